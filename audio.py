@@ -0,0 +1,254 @@
+import numpy as np
+
+# WAV format tags
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+
+
+class Resampler(object):
+    """
+    Resampler for a stream of mono samples.
+
+    When downsampling, the signal first goes through a low-pass filter (a
+    windowed sinc FIR) that removes what lies above the new Nyquist
+    frequency, which would otherwise alias into the audible range. The
+    filtered signal is then linearly interpolated.
+
+    The filter history, the position of the next output sample and the last
+    input sample are carried over from one block to the next, so a phrase
+    resampled block by block matches resampling it in one go (to within
+    rounding), with no clicks at block boundaries. The filter holds back
+    half its length of audio, so call finish() at the end of the phrase.
+    """
+    def __init__(self, input_rate, output_rate, taps=101):
+        self.input_rate = input_rate
+        self.output_rate = output_rate
+        # Distance between output samples, in input samples
+        self.step = input_rate / output_rate
+        # Position of the next output sample, relative to the start of the
+        # next block (including the carried over sample)
+        self._position = 0.0
+        self._previous = None
+        self.filter = None
+        if output_rate < input_rate:
+            # Cut off a little below the output's Nyquist frequency, in
+            # cycles per input sample
+            cutoff = 0.45 * output_rate / input_rate
+            n = np.arange(taps) - (taps - 1) / 2
+            kernel = 2 * cutoff * np.sinc(2 * cutoff * n) * np.hamming(taps)
+            self.filter = kernel / kernel.sum()
+            self._history = np.zeros(len(self.filter) - 1)
+            # The filter output lags the input by half the filter length.
+            # Drop that much from the start, and flush it out in finish().
+            self.delay = (len(self.filter) - 1) // 2
+            self._skip = self.delay
+
+    def _lowpass(self, samples):
+        if not len(samples):
+            # np.convolve() would swap its arguments if the filter were the
+            # longer one
+            return samples
+        samples = np.concatenate((self._history, samples))
+        self._history = samples[len(samples) - len(self._history):]
+        filtered = np.convolve(samples, self.filter, mode='valid')
+        if self._skip:
+            skipped = min(self._skip, len(filtered))
+            filtered = filtered[skipped:]
+            self._skip -= skipped
+        return filtered
+
+    def process(self, samples):
+        if self.filter is not None:
+            samples = self._lowpass(samples)
+        return self._interpolate(samples)
+
+    def finish(self):
+        """
+        Call at the end of the stream. Returns the output samples the
+        filter was still holding back.
+        """
+        if self.filter is None:
+            return np.zeros(0)
+        return self._interpolate(self._lowpass(np.zeros(self.delay)))
+
+    def _interpolate(self, samples):
+        if self._previous is not None:
+            samples = np.concatenate(([self._previous], samples))
+        if not len(samples):
+            # An empty block before any audio (the silence trimmer holds
+            # back leading silence)
+            return np.zeros(0)
+        last = len(samples) - 1
+        if last < self._position:
+            count = 0
+        else:
+            count = int((last - self._position) // self.step) + 1
+        positions = self._position + self.step * np.arange(count)
+        output = np.interp(positions, np.arange(len(samples)), samples)
+        self._position += count * self.step - last
+        self._previous = samples[-1]
+        return output
+
+
+class AudioConverter(object):
+    """
+    Convert the 16 bit mono PCM blocks Piper produces to the sample rate,
+    sample format and channel count of the playback device, one block at
+    a time. Create one converter per phrase, since resampling carries state
+    from block to block.
+    """
+    def __init__(self, input_rate, output_rate=None, sample_format='int16', channels=1):
+        if sample_format not in ('int16', 'float32'):
+            raise ValueError(f"Unsupported sample format {sample_format}")
+        self.input_rate = input_rate
+        self.output_rate = output_rate or input_rate
+        self.sample_format = sample_format
+        self.channels = channels
+        self.resampler = None
+        if self.output_rate != input_rate:
+            self.resampler = Resampler(input_rate, self.output_rate)
+
+    @property
+    def passthrough(self):
+        return (
+            self.resampler is None
+            and self.sample_format == 'int16'
+            and self.channels == 1
+        )
+
+    @property
+    def wav_params(self):
+        """
+        Keyword arguments describing the output for the WAV header functions
+        """
+        if self.sample_format == 'float32':
+            bits_per_sample, audio_format = 32, WAVE_FORMAT_IEEE_FLOAT
+        else:
+            bits_per_sample, audio_format = 16, WAVE_FORMAT_PCM
+        return {
+            'sample_rate': self.output_rate,
+            'bits_per_sample': bits_per_sample,
+            'channels': self.channels,
+            'audio_format': audio_format
+        }
+
+    def convert(self, pcm):
+        if self.passthrough:
+            return pcm
+        samples = np.frombuffer(pcm, dtype=np.int16)
+        if self.resampler is not None:
+            samples = self.resampler.process(samples.astype(np.float32))
+        return self._format(samples)
+
+    def finish(self):
+        """
+        Call at the end of the phrase. Returns whatever converted audio the
+        resampler was still holding back.
+        """
+        if self.resampler is None:
+            return b''
+        return self._format(self.resampler.finish())
+
+    def _format(self, samples):
+        if self.sample_format == 'float32':
+            samples = (samples / 32768.0).astype(np.float32)
+        elif samples.dtype != np.int16:
+            samples = np.clip(np.round(samples), -32768, 32767).astype(np.int16)
+        if self.channels > 1:
+            # Interleave the same signal on every channel
+            samples = np.repeat(samples, self.channels)
+        return samples.tobytes()
+
+
+class SilenceTrimmer(object):
+    """
+    Energy based trimming of the near-silence Piper puts at the start and
+    end of a phrase, and optionally shortening of long pauses between
+    sentences.
+
+    Works on blocks of 16 bit mono PCM as they are produced. Audio is split
+    into frames of frame_ms, and a frame counts as speech when its RMS level
+    is at least threshold_db (relative to full scale). Speech is released as
+    soon as it is seen, so in streaming mode the first block goes out the
+    moment it contains speech. Silence is held back until we know whether
+    more speech follows it:
+      - before the first speech, only the last padding_ms is kept
+      - between speech, a pause longer than max_pause_ms is cut down to
+        max_pause_ms by removing its middle (if max_pause_ms is set)
+      - after the last speech, only the first padding_ms is kept
+    """
+    def __init__(self, sample_rate, threshold_db=-40.0, padding_ms=50, max_pause_ms=None, frame_ms=10):
+        self.frame = max(1, int(sample_rate * frame_ms / 1000))
+        self.padding = int(sample_rate * padding_ms / 1000)
+        self.max_pause = None
+        if max_pause_ms:
+            self.max_pause = max(self.padding, int(sample_rate * max_pause_ms / 1000))
+        # RMS level of a frame at the threshold, on the int16 scale
+        self.threshold = 32768.0 * 10 ** (threshold_db / 20)
+        self._remainder = np.zeros(0, dtype=np.int16)
+        self._silence = np.zeros(0, dtype=np.int16)
+        self._speech_seen = False
+
+    def _hold(self, samples):
+        silence = np.concatenate((self._silence, samples))
+        # Never hold more silence than we could end up releasing
+        if not self._speech_seen:
+            silence = silence[len(silence) - self.padding:] if self.padding else silence[:0]
+        elif self.max_pause is not None and len(silence) > self.max_pause:
+            head = self.max_pause // 2
+            silence = np.concatenate((silence[:head], silence[len(silence) - (self.max_pause - head):]))
+        self._silence = silence
+
+    def _release_silence(self):
+        silence = self._silence
+        self._silence = silence[:0]
+        if not self._speech_seen:
+            return silence[len(silence) - self.padding:] if self.padding else silence[:0]
+        return silence
+
+    def _speech_frames(self, samples):
+        frames = samples[:len(samples) // self.frame * self.frame].reshape(-1, self.frame)
+        rms = np.sqrt(np.mean(frames.astype(np.float32) ** 2, axis=1))
+        return np.flatnonzero(rms >= self.threshold)
+
+    def process(self, pcm):
+        """
+        Add a block of PCM, returning the PCM that can be released now
+        """
+        samples = np.concatenate((self._remainder, np.frombuffer(pcm, dtype=np.int16)))
+        whole = len(samples) // self.frame * self.frame
+        self._remainder = samples[whole:]
+        samples = samples[:whole]
+        speech = self._speech_frames(samples)
+        if not len(speech):
+            self._hold(samples)
+            return b''
+        start = speech[0] * self.frame
+        end = (speech[-1] + 1) * self.frame
+        self._hold(samples[:start])
+        output = np.concatenate((self._release_silence(), samples[start:end]))
+        self._speech_seen = True
+        self._silence = samples[end:end]
+        self._hold(samples[end:])
+        return output.tobytes()
+
+    def finish(self):
+        """
+        Call at the end of the phrase. Returns whatever is left to release.
+        """
+        output = b''
+        if len(self._remainder):
+            # A partial frame; pad it out to decide whether it is speech
+            remainder = self._remainder
+            self._remainder = remainder[:0]
+            padded = np.concatenate((remainder, np.zeros(self.frame - len(remainder), dtype=np.int16)))
+            if len(self._speech_frames(padded)):
+                output = np.concatenate((self._release_silence(), remainder)).tobytes()
+                self._speech_seen = True
+            else:
+                self._hold(remainder)
+        if not self._speech_seen:
+            return output
+        trailing = self._silence[:self.padding]
+        self._silence = self._silence[:0]
+        return output + trailing.tobytes()
@@ -0,0 +1,160 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+
+def atomic_write(filename, data):
+    """
+    Write data to filename so that readers either see the old file or the
+    complete new one, never a partially written file.
+    """
+    directory = os.path.dirname(filename) or "."
+    fd, tmp_filename = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        try:
+            os.unlink(tmp_filename)
+        except OSError:
+            pass
+        raise
+
+
+class AudioCache(object):
+    """
+    Content addressed on-disk cache of synthesized utterances.
+
+    Each entry is a WAV file named after a hash of everything that affects
+    the audio (voice, speaker, model file and text), so a hit can be served
+    without loading or running the voice model at all. The total size of
+    the cache is capped, and the least recently used entries are removed
+    first. Access time is tracked through the file modification time so it
+    works on filesystems mounted with noatime.
+    """
+    extension = ".wav"
+
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        # Maximum size of the cache in bytes
+        self.max_size = max_size
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._digests_file = os.path.join(self.directory, "models.json")
+        try:
+            with open(self._digests_file) as f:
+                self._digests = json.load(f)
+        except (OSError, ValueError):
+            self._digests = {}
+        self.size = sum(
+            entry.stat().st_size for entry in self._entries()
+        )
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _entries(self):
+        return [
+            entry for entry in os.scandir(self.directory)
+            if entry.is_file() and entry.name.endswith(self.extension)
+        ]
+
+    def _filename(self, key):
+        return os.path.join(self.directory, f"{key}{self.extension}")
+
+    @staticmethod
+    def normalize(text):
+        """
+        Collapse runs of whitespace. Case is kept since it changes how
+        words are read (NASA is spelled out, nasa is not).
+        """
+        return " ".join(text.split())
+
+    @staticmethod
+    def key(*parts):
+        return hashlib.sha256(
+            json.dumps(parts, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+    def model_digest(self, model_file):
+        """
+        Return the sha256 of a model file. Hashing a 100MB model is slow on
+        small devices, so digests are remembered between runs and only
+        recomputed when the file's size or modification time changes.
+        """
+        stat = os.stat(model_file)
+        with self._lock:
+            known = self._digests.get(model_file)
+            if known and known['mtime'] == stat.st_mtime and known['size'] == stat.st_size:
+                return known['sha256']
+        sha256 = hashlib.sha256()
+        with open(model_file, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha256.update(chunk)
+        digest = sha256.hexdigest()
+        with self._lock:
+            self._digests[model_file] = {
+                'mtime': stat.st_mtime,
+                'size': stat.st_size,
+                'sha256': digest
+            }
+            atomic_write(
+                self._digests_file,
+                json.dumps(self._digests, indent=1).encode("utf-8")
+            )
+        return digest
+
+    def get(self, key):
+        """
+        The cached data for key as a bytearray (the same type say() builds),
+        or None
+        """
+        filename = self._filename(key)
+        try:
+            with open(filename, "rb") as f:
+                data = bytearray(os.fstat(f.fileno()).st_size)
+                # Read straight into the buffer rather than copying
+                del data[f.readinto(data):]
+            # Mark the entry as recently used
+            os.utime(filename)
+        except OSError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def put(self, key, data):
+        filename = self._filename(key)
+        with self._lock:
+            try:
+                self.size -= os.path.getsize(filename)
+            except OSError:
+                pass
+            atomic_write(filename, data)
+            self.size += len(data)
+            if self.size > self.max_size:
+                self._evict()
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda entry: entry.stat().st_mtime)
+        for entry in entries:
+            if self.size <= self.max_size:
+                break
+            try:
+                size = entry.stat().st_size
+                os.unlink(entry.path)
+            except OSError:
+                continue
+            self.size -= size
+            self.evictions += 1
+
+    def stats(self):
+        return {
+            'size': self.size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
@@ -0,0 +1,65 @@
+import numpy as np
+from piper.util import audio_float_to_int16
+
+# Piper's phoneme id for padding ("_")
+PAD_ID = 0
+
+
+def _trim_padding(audio, sample_rate, threshold=0.01, tail=0.05):
+    # Items shorter than the longest one in a batch come back followed by
+    # the decoder's output for the padded frames, which is close to but not
+    # exactly silence. The model does not report the real length, so cut
+    # everything after the last sample above threshold (relative to the
+    # item's peak), keeping a short tail so words are not clipped.
+    peak = np.max(np.abs(audio)) if len(audio) else 0
+    if peak == 0:
+        return audio[:0]
+    loud = np.flatnonzero(np.abs(audio) > peak * threshold)
+    end = min(len(audio), loud[-1] + 1 + int(tail * sample_rate))
+    return audio[:end]
+
+
+def synthesize_batch(pipervoice, sentences, speaker_id=None):
+    """
+    Synthesize a list of phoneme id sequences with a single run of the
+    model by padding them to the same length. Returns a list of raw 16 bit
+    PCM blocks in the same order as sentences.
+
+    A batch of one is passed straight to synthesize_ids_to_raw(), so it is
+    identical to unbatched synthesis. In larger batches, items shorter than
+    the longest have the audio for their padding trimmed off, which can
+    also shorten a quiet ending, so the audio is not guaranteed to match
+    unbatched synthesis exactly.
+    """
+    if len(sentences) == 1:
+        return [pipervoice.synthesize_ids_to_raw(sentences[0], speaker_id=speaker_id)]
+    config = pipervoice.config
+    lengths = np.array([len(phoneme_ids) for phoneme_ids in sentences], dtype=np.int64)
+    phoneme_ids_array = np.full((len(sentences), lengths.max()), PAD_ID, dtype=np.int64)
+    for i, phoneme_ids in enumerate(sentences):
+        phoneme_ids_array[i, :len(phoneme_ids)] = phoneme_ids
+    args = {
+        "input": phoneme_ids_array,
+        "input_lengths": lengths,
+        "scales": np.array(
+            [config.noise_scale, config.length_scale, config.noise_w],
+            dtype=np.float32
+        )
+    }
+    if config.num_speakers > 1:
+        args["sid"] = np.full(
+            len(sentences),
+            0 if speaker_id is None else speaker_id,
+            dtype=np.int64
+        )
+    # (batch, 1, samples)
+    audio = pipervoice.session.run(None, args)[0]
+    audio = audio.reshape(len(sentences), -1)
+    # Only items shorter than the longest were padded
+    return [
+        audio_float_to_int16(
+            _trim_padding(audio[i], config.sample_rate)
+            if lengths[i] < lengths.max() else audio[i]
+        ).tobytes()
+        for i in range(len(sentences))
+    ]
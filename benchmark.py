@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark the Piper TTS plugin against the voices that are already
+installed. Nothing is downloaded, so this can be run offline.
+
+For each voice, reports the model load time, the real-time factor
+(synthesis time / audio duration), time to first audio through
+say_stream(), p50/p95 say() latency, say_many() throughput and peak
+resident memory. Each voice is benchmarked in a new process, so its memory
+figures are its own. Results are written as JSON.
+
+Run from the Naomi directory, for example:
+    python -m plugins.tts.piper_tts.benchmark --locale en-US --output bench.json
+"""
+import argparse
+import gettext
+import json
+import math
+import os
+import platform
+import resource
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from naomi import profile
+from .parallel import worker_context
+from .parallel import worker_module
+from .piper_tts import PiperTTSPlugin
+
+CORPUS = {
+    'en-US': [
+        "Hello.",
+        "I didn't catch that.",
+        "Your timer for ten minutes has been set.",
+        "The weather today will be partly cloudy with a high of seventy two degrees.",
+        " ".join([
+            "Here is a summary of today's news.",
+            "Local officials have announced a new plan to repair the bridge downtown.",
+            "The work is expected to take about six months, and detours will be posted.",
+            "In sports, the home team won their third game in a row last night."
+        ])
+    ],
+    'de-DE': [
+        "Hallo.",
+        "Das habe ich nicht verstanden.",
+        "Dein Timer für zehn Minuten wurde gestellt.",
+        "Das Wetter wird heute teilweise bewölkt bei höchstens zweiundzwanzig Grad.",
+        " ".join([
+            "Hier ist eine Zusammenfassung der heutigen Nachrichten.",
+            "Die Stadt hat einen neuen Plan zur Reparatur der Brücke in der Innenstadt vorgestellt.",
+            "Die Arbeiten werden etwa sechs Monate dauern, Umleitungen werden ausgeschildert.",
+            "Im Sport hat die Heimmannschaft gestern Abend ihr drittes Spiel in Folge gewonnen."
+        ])
+    ],
+    'fr-FR': [
+        "Bonjour.",
+        "Je n'ai pas compris.",
+        "Votre minuteur de dix minutes a été réglé.",
+        "Le temps sera partiellement nuageux aujourd'hui avec un maximum de vingt deux degrés.",
+        " ".join([
+            "Voici un résumé de l'actualité du jour.",
+            "La mairie a annoncé un nouveau plan pour réparer le pont du centre-ville.",
+            "Les travaux devraient durer environ six mois et des déviations seront mises en place.",
+            "En sport, l'équipe locale a remporté hier soir son troisième match consécutif."
+        ])
+    ]
+}
+
+# Checked in this order so "x_low" is not mistaken for "low"
+QUALITIES = ['x_low', 'low', 'medium', 'high']
+
+
+def quality(model_file):
+    name = os.path.splitext(os.path.basename(model_file))[0]
+    for tier in QUALITIES:
+        if name.endswith(f"-{tier}"):
+            return tier
+    return None
+
+
+def percentile(values, pct):
+    """
+    Nearest-rank percentile
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[rank]
+
+
+def peak_rss():
+    """
+    Peak resident set size of this process in bytes
+    """
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+def wav_duration(wav):
+    """
+    Duration in seconds of a WAV file with a 44 byte header
+    """
+    byte_rate = struct.unpack_from('<i', wav, 28)[0]
+    return (len(wav) - 44) / byte_rate
+
+
+class BenchmarkPlugin(PiperTTSPlugin):
+    """
+    The plugin with installing and quantizing turned off. Only voices that
+    are already installed are benchmarked, and checking them against the
+    manifest (or the server, for voices installed without one) would be
+    counted as load time.
+    """
+    def install_voice(self, locale, voice):
+        pass
+
+    def quantize_voice(self, locale, voice):
+        pass
+
+
+def make_plugin(locale):
+    # A minimal stand-in for the plugin info Naomi normally passes in
+    info = type('', (object,), {
+        'name': 'piper-tts-benchmark',
+        'translations': {
+            locale: gettext.NullTranslations()
+        }
+    })()
+    tts = BenchmarkPlugin(info)
+    # Measure synthesis rather than cache lookups
+    tts.audio_cache = None
+    return tts
+
+
+def installed_voices(locale):
+    voices = []
+    for voice in PiperTTSPlugin.voices.get(locale, {}):
+        model_file = PiperTTSPlugin.get_model_file(voice, locale)
+        if os.path.isfile(model_file) and os.path.isfile(f"{model_file}.json"):
+            voices.append(voice)
+    return voices
+
+
+def benchmark_voice(tts, voice, corpus, repeat=1):
+    locale = profile.get(['language'])
+    # Start from a cold model every time
+    tts.voice_cache.clear()
+    tts.current_voice = None
+    # Time the model load itself
+    load_times = []
+
+    def model_load_hook(stage, seconds, info):
+        if stage == 'model_load':
+            load_times.append(seconds)
+    tts.instrumentation.add_hook(model_load_hook)
+    try:
+        tts.activate_voice(voice)
+    finally:
+        tts.instrumentation.remove_hook(model_load_hook)
+    load_time = sum(load_times)
+
+    start = time.perf_counter()
+    tts.say(corpus[0], voice)
+    first_say = time.perf_counter() - start
+
+    latencies = []
+    synthesis_time = 0.0
+    audio_time = 0.0
+    for i in range(repeat):
+        for phrase in corpus:
+            start = time.perf_counter()
+            wav = tts.say(phrase, voice)
+            elapsed = time.perf_counter() - start
+            latencies.append(elapsed)
+            synthesis_time += elapsed
+            audio_time += wav_duration(wav)
+
+    first_audio = []
+    for phrase in corpus:
+        start = time.perf_counter()
+        stream = tts.say_stream(phrase, voice, raw=True)
+        next(stream)
+        first_audio.append(time.perf_counter() - start)
+        for block in stream:
+            pass
+
+    tts.say_many(corpus, voice)
+    batch_stats = dict(tts.last_batch_stats)
+
+    # The int8 copy if quantized voices are on and it has been made
+    model_file = tts.get_runtime_model_file(voice, locale)
+    return {
+        'locale': locale,
+        'voice': voice,
+        'quality': quality(tts.get_model_file(voice, locale)),
+        'model_file': os.path.basename(model_file),
+        'model_size': os.path.getsize(model_file),
+        'load_seconds': load_time,
+        'first_say_seconds': first_say,
+        'real_time_factor': synthesis_time / audio_time if audio_time else None,
+        'time_to_first_audio': {
+            'p50': percentile(first_audio, 50),
+            'p95': percentile(first_audio, 95)
+        },
+        'latency': {
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95)
+        },
+        'batch': batch_stats,
+        'peak_rss': peak_rss()
+    }
+
+
+def _benchmark_worker(locale, voice, corpus, repeat):
+    # Runs in a new process for each voice, since peak_rss() is the high
+    # water mark for the whole process
+    profile.set_profile_var(['language'], locale)
+    # Start the plugin with the voice being benchmarked, so nothing is
+    # downloaded, and without background work that would skew timings
+    profile.set_profile_var(['piper-tts', 'voice'], voice)
+    profile.set_profile_var(['piper-tts', 'preload'], [])
+    profile.set_profile_var(['piper-tts', 'warmup'], False)
+    return benchmark_voice(make_plugin(locale), voice, corpus, repeat)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        '--locale',
+        action='append',
+        choices=sorted(CORPUS),
+        help="locale to benchmark, may be repeated (default: all)"
+    )
+    parser.add_argument(
+        '--voice',
+        action='append',
+        help="voice to benchmark, may be repeated (default: all installed)"
+    )
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=3,
+        help="number of times to say each phrase"
+    )
+    parser.add_argument(
+        '--output',
+        help="file to write the JSON results to (default: stdout)"
+    )
+    args = parser.parse_args(argv)
+
+    module = worker_module('benchmark')
+    results = []
+    for locale in args.locale or sorted(CORPUS):
+        voices = [
+            voice for voice in installed_voices(locale)
+            if not args.voice or voice in args.voice
+        ]
+        for voice in voices:
+            print(f"Benchmarking {locale} {voice}", file=sys.stderr)
+            with ProcessPoolExecutor(max_workers=1, mp_context=worker_context()) as executor:
+                results.append(executor.submit(
+                    module._benchmark_worker,
+                    locale,
+                    voice,
+                    CORPUS[locale],
+                    args.repeat
+                ).result())
+
+    report = {
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,291 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from .audio_cache import atomic_write
+
+_logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+CHUNK_SIZE = 1024 * 1024
+# Hugging Face reports the sha256 and size of large files in these headers
+# on its redirect to the CDN. A plain ETag is an opaque tag, not a hash, so
+# it is only used to check that a partial download can be resumed.
+_SHA256_HEADER = "X-Linked-Etag"
+_SIZE_HEADER = "X-Linked-Size"
+_SHA256 = re.compile(r'^"?([0-9a-f]{64})"?$')
+
+# One lock per directory so two threads never install into the same
+# directory at once
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+class DownloadError(IOError):
+    pass
+
+
+class _RecordingRedirectHandler(urllib.request.HTTPRedirectHandler):
+    """
+    Follows redirects like the default handler, keeping the headers of each
+    redirect response, since urlopen() only returns those of the last one.
+    A HEAD request stays a HEAD request, where the default handler would
+    turn it into a GET and download the file.
+    """
+    def __init__(self):
+        self.headers = []
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        self.headers.append(headers)
+        new_request = super().redirect_request(req, fp, code, msg, headers, newurl)
+        if new_request is not None and req.get_method() == "HEAD":
+            new_request.method = "HEAD"
+        return new_request
+
+
+def _open(request, timeout):
+    # Returns the response and the headers of every response on the way to
+    # it, redirects first
+    redirects = _RecordingRedirectHandler()
+    response = urllib.request.build_opener(redirects).open(request, timeout=timeout)
+    return response, redirects.headers + [response.headers]
+
+
+def _directory_lock(directory):
+    with _locks_lock:
+        return _locks.setdefault(os.path.abspath(directory), threading.Lock())
+
+
+def sha256_file(filename):
+    sha256 = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _linked_sha256(headers_list):
+    for headers in headers_list:
+        match = _SHA256.match(headers.get(_SHA256_HEADER) or "")
+        if match:
+            return match.group(1)
+    return None
+
+
+def _linked_size(headers_list):
+    for headers in headers_list:
+        size = headers.get(_SIZE_HEADER) or ""
+        if size.isdigit():
+            return int(size)
+    return None
+
+
+def _total_size(response, offset):
+    # For a ranged response the full size is after the slash in
+    # "Content-Range: bytes 1000-9999/10000"
+    content_range = response.headers.get("Content-Range")
+    if content_range and "/" in content_range:
+        total = content_range.rsplit("/", 1)[1]
+        if total.isdigit():
+            return int(total)
+    length = response.headers.get("Content-Length")
+    if length and length.isdigit():
+        return offset + int(length)
+    return None
+
+
+def _validator(headers):
+    # Identifies the version of the file a partial download belongs to: a
+    # strong ETag, or failing that the modification time
+    etag = headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return headers.get("Last-Modified")
+
+
+def _discard_part(part_filename):
+    for name in (part_filename, f"{part_filename}.validator"):
+        if os.path.exists(name):
+            os.unlink(name)
+
+
+def download(url, filename, expected_size=None, expected_sha256=None, timeout=60):
+    """
+    Download url to filename.
+
+    Data is written to filename + ".part", and an existing partial file is
+    resumed with a ranged request. The request carries the version of the
+    file the partial download came from (If-Range), so if the file has
+    changed on the server since, it is downloaded again from the start.
+    Once the download is complete its size is checked against
+    expected_size and the size reported by the server, and its sha256
+    against expected_sha256. If these are not given, the size and sha256
+    Hugging Face reports on its redirect are used, if any. Only then is it
+    renamed to filename, so filename is never a truncated file.
+    Returns a (size, sha256) tuple.
+    """
+    part_filename = f"{filename}.part"
+    validator_filename = f"{part_filename}.validator"
+    offset = 0
+    if os.path.isfile(part_filename):
+        try:
+            with open(validator_filename) as f:
+                validator = f.read().strip()
+        except OSError:
+            validator = None
+        # Without a validator there's no telling what the partial file is
+        # part of, so start again
+        if validator:
+            offset = os.path.getsize(part_filename)
+    request = urllib.request.Request(url)
+    if offset:
+        request.add_header("Range", f"bytes={offset}-")
+        request.add_header("If-Range", validator)
+    try:
+        response, headers = _open(request, timeout)
+    except urllib.error.HTTPError as e:
+        if e.code == 416 and offset:
+            # The partial file doesn't match what the server has, start over
+            _discard_part(part_filename)
+            return download(url, filename, expected_size, expected_sha256, timeout)
+        raise
+    with response:
+        if offset and response.status != 206:
+            # The server is sending the whole file, because it ignores
+            # ranges or because the file has changed
+            offset = 0
+        total_size = _total_size(response, offset)
+        if expected_sha256 is None:
+            expected_sha256 = _linked_sha256(headers)
+        if expected_size is None:
+            expected_size = _linked_size(headers)
+        if not offset:
+            validator = _validator(response.headers)
+            if validator:
+                atomic_write(validator_filename, validator.encode("utf-8"))
+            elif os.path.exists(validator_filename):
+                os.unlink(validator_filename)
+        with open(part_filename, "ab" if offset else "wb") as f:
+            for chunk in iter(lambda: response.read(CHUNK_SIZE), b''):
+                f.write(chunk)
+    size = os.path.getsize(part_filename)
+    if total_size is not None and size < total_size:
+        # Keep the partial file so the next attempt can resume
+        raise DownloadError(f"Download of {url} stopped at {size} of {total_size} bytes")
+    if (
+        (total_size is not None and size != total_size)
+        or (expected_size is not None and size != expected_size)
+    ):
+        _discard_part(part_filename)
+        raise DownloadError(f"Download of {url} is {size} bytes, expected {expected_size or total_size}")
+    sha256 = sha256_file(part_filename)
+    if expected_sha256 is not None and sha256 != expected_sha256:
+        _discard_part(part_filename)
+        raise DownloadError(f"Download of {url} has sha256 {sha256}, expected {expected_sha256}")
+    os.replace(part_filename, filename)
+    _discard_part(part_filename)
+    return size, sha256
+
+
+def remote_info(url, timeout=10):
+    """
+    The size and sha256 of the file at url according to the server, as a
+    (size, sha256) tuple. Either is None if it can't be found out.
+    """
+    try:
+        request = urllib.request.Request(url, method="HEAD")
+        response, headers = _open(request, timeout)
+        with response:
+            size = _linked_size(headers)
+            if size is None:
+                size = _total_size(response, 0)
+            return size, _linked_sha256(headers)
+    except (OSError, ValueError):
+        return None, None
+
+
+def _fetch(url, filename):
+    expected_size, expected_sha256 = remote_info(url)
+    return download(url, filename, expected_size, expected_sha256)
+
+
+def read_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _is_installed(directory, name, url, manifest, verify=False):
+    filename = os.path.join(directory, name)
+    if not os.path.isfile(filename):
+        return False
+    size = os.path.getsize(filename)
+    entry = manifest.get(name)
+    if entry is None:
+        # Installed before manifests were kept. Compare against the size
+        # and hash on the server, and if we can't reach it, trust the file.
+        expected_size, expected_sha256 = remote_info(url)
+        if expected_size is not None and size != expected_size:
+            _logger.warning(f"{filename} is {size} bytes, expected {expected_size}")
+            return False
+        sha256 = sha256_file(filename)
+        if expected_sha256 is not None and sha256 != expected_sha256:
+            _logger.warning(f"{filename} does not match the sha256 on the server")
+            return False
+        manifest[name] = {'url': url, 'size': size, 'sha256': sha256}
+        return True
+    if size != entry['size']:
+        _logger.warning(f"{filename} is {size} bytes, expected {entry['size']}")
+        return False
+    if verify and sha256_file(filename) != entry['sha256']:
+        _logger.warning(f"{filename} does not match its recorded sha256")
+        return False
+    return True
+
+
+def install(directory, files, workers=2, verify=False):
+    """
+    Make sure every file in files, a dictionary of filename: url, is present
+    and complete in directory. Missing or damaged files are downloaded at
+    the same time on up to workers threads.
+
+    The size and sha256 of each file are recorded in a manifest in the
+    directory. Sizes are checked on every call, which is cheap; hashes are
+    only checked again if verify is True.
+    """
+    os.makedirs(directory, exist_ok=True)
+    with _directory_lock(directory):
+        manifest = read_manifest(directory)
+        before = json.dumps(manifest, sort_keys=True)
+        missing = {
+            name: url for name, url in files.items()
+            if not _is_installed(directory, name, url, manifest, verify)
+        }
+        errors = []
+        if missing:
+            with ThreadPoolExecutor(max_workers=max(1, min(workers, len(missing)))) as executor:
+                futures = {
+                    name: executor.submit(_fetch, url, os.path.join(directory, name))
+                    for name, url in missing.items()
+                }
+                for name, future in futures.items():
+                    try:
+                        size, sha256 = future.result()
+                    except Exception as e:
+                        errors.append(e)
+                        continue
+                    manifest[name] = {'url': missing[name], 'size': size, 'sha256': sha256}
+        if json.dumps(manifest, sort_keys=True) != before:
+            atomic_write(
+                os.path.join(directory, MANIFEST),
+                json.dumps(manifest, indent=1).encode("utf-8")
+            )
+        if errors:
+            raise errors[0]
@@ -0,0 +1,86 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Instrumentation(object):
+    """
+    Timing spans and counters for the synthesis pipeline.
+
+    Each stage of producing audio (model load, config parsing,
+    phonemization, inference, WAV assembly) is wrapped in a span. When a
+    span finishes, every registered hook is called as
+    hook(stage, seconds, info), where info is a dictionary of details about
+    the call. In profiling mode each span is also written to the log.
+    When profiling is off and no hooks are registered, spans are not timed
+    at all.
+
+    Counters (model loads, voice switches, bytes produced, ...) are always
+    kept since they cost next to nothing.
+    """
+    def __init__(self, profiling=False, logger=None):
+        self.profiling = profiling
+        self.hooks = []
+        self.counters = {}
+        # stage -> {'count', 'total', 'max'} in seconds
+        self.timings = {}
+        self._logger = logger or logging.getLogger(__name__)
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.profiling or bool(self.hooks)
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    @contextmanager
+    def span(self, stage, **info):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start, **info)
+
+    def record(self, stage, seconds, **info):
+        with self._lock:
+            timing = self.timings.setdefault(
+                stage,
+                {'count': 0, 'total': 0.0, 'max': 0.0}
+            )
+            timing['count'] += 1
+            timing['total'] += seconds
+            timing['max'] = max(timing['max'], seconds)
+        if self.profiling:
+            self._logger.info(f"piper-tts {stage}: {seconds * 1000:.1f}ms {info}")
+        for hook in list(self.hooks):
+            try:
+                hook(stage, seconds, info)
+            except Exception as e:
+                # A broken hook shouldn't stop Naomi from talking
+                self._logger.warning(f"piper-tts instrumentation hook failed: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'counters': dict(self.counters),
+                'timings': {
+                    stage: dict(timing) for stage, timing in self.timings.items()
+                }
+            }
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.timings.clear()
@@ -0,0 +1,116 @@
+import importlib
+import multiprocessing
+import os
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from .session import load_voice
+
+# The voice loaded in each worker process
+_worker_voice = None
+
+
+def _init_worker(model_file, settings):
+    global _worker_voice
+    _worker_voice = load_voice(model_file, settings)
+
+
+def _synthesize(phoneme_ids, speaker_id):
+    return _worker_voice.synthesize_ids_to_raw(phoneme_ids, speaker_id=speaker_id)
+
+
+def worker_module(name):
+    """
+    Import the module name from this plugin in a way that processes started
+    by worker_context() can import it too
+    """
+    # Workers are started fresh rather than forked, since forking a process
+    # that is running onnxruntime (and possibly the preload thread) can
+    # deadlock. A fresh process has to import the functions it runs, but
+    # Naomi loads plugins from their directory, so the name this module was
+    # loaded under may not be importable there. Import it again by its path
+    # instead; workers inherit sys.path.
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    parent_dir, package = os.path.split(package_dir)
+    if parent_dir not in sys.path:
+        sys.path.append(parent_dir)
+    return importlib.import_module(f"{package}.{name}")
+
+
+def worker_context():
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context('spawn')
+
+
+class SentencePool(object):
+    """
+    Pool of worker processes used to synthesize the sentences of a phrase
+    at the same time. Each worker loads its own copy of the voice. A set of
+    workers is kept for each of the max_models most recently used models,
+    so switching back and forth between voices doesn't reload them.
+
+    Sentences are phonemized in the calling process and only the phoneme
+    ids are sent to the workers, which run the same synthesize_ids_to_raw()
+    call as the serial path with the same arguments.
+    """
+    def __init__(self, workers, settings=None, max_models=1):
+        self.workers = workers
+        self.max_models = max(1, max_models)
+        # onnxruntime session settings for the workers. Unless told
+        # otherwise, each worker uses a single thread so the workers don't
+        # compete with each other for cores.
+        self.settings = dict(settings or {})
+        if not self.settings.get('intra_op_threads'):
+            self.settings['intra_op_threads'] = 1
+        # model file -> ProcessPoolExecutor, least recently used first
+        self._executors = OrderedDict()
+        self._lock = threading.Lock()
+        self._module = None
+
+    def _get_executor(self, model_file):
+        with self._lock:
+            executor = self._executors.get(model_file)
+            if executor is not None:
+                self._executors.move_to_end(model_file)
+                return executor
+            if self._module is None:
+                self._module = worker_module('parallel')
+            executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=worker_context(),
+                initializer=self._module._init_worker,
+                initargs=(model_file, self.settings)
+            )
+            self._executors[model_file] = executor
+            while len(self._executors) > self.max_models:
+                # Work already submitted to the old workers still finishes
+                self._executors.popitem(last=False)[1].shutdown(wait=False)
+            return executor
+
+    def synthesize(self, model_file, sentences, speaker_id=None):
+        """
+        Generator yielding the raw audio for each list of phoneme ids in
+        sentences, in the original order. Each block is yielded as soon as it
+        and all the blocks before it are ready.
+        """
+        executor = self._get_executor(model_file)
+        futures = [
+            executor.submit(self._module._synthesize, phoneme_ids, speaker_id)
+            for phoneme_ids in sentences
+        ]
+        try:
+            for future in futures:
+                yield future.result()
+        finally:
+            # If the caller stops listening, don't keep the workers busy
+            for future in futures:
+                future.cancel()
+
+    def shutdown(self, wait=False):
+        with self._lock:
+            executors = list(self._executors.values())
+            self._executors.clear()
+        for executor in executors:
+            executor.shutdown(wait=wait)
@@ -0,0 +1,124 @@
+import json
+import re
+import threading
+from collections import OrderedDict
+from .audio_cache import atomic_write
+
+# Sentence ending punctuation followed by whitespace and a letter. espeak
+# starts a new sentence at every one of these that is followed by an upper
+# case letter, and phonemizes each sentence on its own, so a phrase can be
+# split there without changing how it is read. Places where it's not clear
+# are left alone: espeak splits the piece itself.
+_SENTENCE_END = re.compile(r'([.!?]+)[^\S\n]+(?=[^\W\d_])')
+# Line breaks can end a sentence for espeak and change how the sentence
+# before is read, so phrases are never split at them.
+
+# Words a period often follows without ending a sentence. Single letters
+# (initials, "z. B.") and words with periods in them ("e.g.", "U.S.") are
+# never split after either.
+_ABBREVIATIONS = {
+    'mr', 'mrs', 'ms', 'dr', 'st', 'jr', 'sr', 'prof', 'etc', 'vs', 'no',
+    'fig', 'ca', 'nr', 'bzw', 'usw', 'mme', 'mlle'
+}
+
+
+def _ends_sentence(text, punctuation):
+    if punctuation != '.':
+        # An ellipsis doesn't end a sentence for espeak, "!" and "?" do
+        return '.' not in punctuation
+    words = text.split()
+    word = words[-1].lstrip('"\'(') if words else ''
+    return len(word) > 1 and '.' not in word and word.lower() not in _ABBREVIATIONS
+
+
+def split_sentences(text):
+    """
+    Split text into pieces at sentence ends espeak would also split at,
+    dropping the whitespace between them and around the text. Whitespace
+    within a piece is kept as it is, since espeak reads a run of spaces or
+    a line break as a pause.
+    A piece may still hold more than one sentence.
+    """
+    pieces = []
+    start = 0
+    for match in _SENTENCE_END.finditer(text):
+        if text[match.end()].isupper() and _ends_sentence(text[start:match.start()], match.group(1)):
+            pieces.append(text[start:match.end(1)])
+            start = match.end()
+    pieces.append(text[start:])
+    # Spaces and tabs at either end make no difference to espeak
+    pieces[0] = pieces[0].lstrip(" \t")
+    pieces[-1] = pieces[-1].rstrip(" \t")
+    return pieces
+
+
+class PhonemeCache(object):
+    """
+    Least recently used cache of phoneme ids for sentences.
+
+    Keys combine a fingerprint of the voice's phoneme settings (phonemizer,
+    espeak voice and phoneme id map) with the text of a piece from
+    split_sentences(), so voices that phonemize text the same way share
+    entries. Each entry holds the phoneme ids for every sentence
+    espeak found in the piece.
+    If a filename is given, the cache is loaded from it at startup and can
+    be written back with save().
+    """
+    def __init__(self, max_entries=2000, filename=None):
+        self.max_entries = max_entries
+        self.filename = filename
+        # key -> list of lists of phoneme ids (one list per sentence)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        if filename:
+            self.load()
+
+    @staticmethod
+    def key(phoneme_key, sentence):
+        return f"{phoneme_key}\n{sentence}"
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+        return None
+
+    def put(self, key, phoneme_ids):
+        with self._lock:
+            self._entries[key] = phoneme_ids
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._dirty = True
+
+    def load(self):
+        try:
+            with open(self.filename) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return
+        with self._lock:
+            for key, phoneme_ids in entries[-self.max_entries:]:
+                self._entries[key] = phoneme_ids
+
+    def save(self):
+        if not (self.filename and self._dirty):
+            return
+        with self._lock:
+            data = json.dumps(list(self._entries.items()))
+            self._dirty = False
+        atomic_write(self.filename, data.encode("utf-8"))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses
+            }
@@ -1,12 +1,31 @@
-import json
+import asyncio
+import atexit
 import os
 import struct
+import threading
+import time
+import numpy as np
 from collections import OrderedDict
-from naomi import app_utils
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from naomi import paths
 from naomi import plugin
 from naomi import profile
-from piper.voice import PiperVoice
+from .audio import AudioConverter
+from .audio import SilenceTrimmer
+from .audio import WAVE_FORMAT_IEEE_FLOAT
+from .audio import WAVE_FORMAT_PCM
+from .audio_cache import AudioCache
+from .batch import synthesize_batch
+from . import installer
+from . import quantize
+from .instrumentation import Instrumentation
+from .parallel import SentencePool
+from .phoneme_cache import PhonemeCache
+from .phoneme_cache import split_sentences
+from .session import load_voice
+from .voice_cache import VoiceCache
+from .voice_config import VoiceConfigIndex
 
 
 class PiperTTSPlugin(plugin.TTSPlugin):
@@ -233,9 +252,18 @@ class PiperTTSPlugin(plugin.TTSPlugin):
             }
         }
     }
+    # Parsed voice config files, shared by all instances. Entries are
+    # refreshed when the file on disk changes.
+    voice_configs = VoiceConfigIndex()
 
     def __init__(self, *args, **kwargs):
         plugin.TTSPlugin.__init__(self, *args, **kwargs)
+        # Timing spans and counters for each stage of synthesis. Callers can
+        # register their own hooks with self.instrumentation.add_hook()
+        self.instrumentation = Instrumentation(
+            profiling=profile.get_profile_flag(['piper-tts', 'profiling'], False),
+            logger=self._logger
+        )
         self.voice = profile.get(['piper-tts', 'voice'])
         self.current_voice = self.voice
         self.speaker = profile.get(['piper-tts', 'speaker'])
@@ -246,20 +274,179 @@ class PiperTTSPlugin(plugin.TTSPlugin):
         )
         self.current_speaker_id = self.speaker_id
         self.sample_rate = {}
+        # Keep recently used voices loaded so switching between them does
+        # not mean reloading the model every time
+        max_memory = profile.get(['piper-tts', 'voice_cache', 'max_memory_mb'])
+        self.voice_cache = VoiceCache(
+            max_voices=int(profile.get(['piper-tts', 'voice_cache', 'max_voices'], 2)),
+            max_memory=int(float(max_memory) * 1024 * 1024) if max_memory else None
+        )
+        # Optional on-disk cache of synthesized phrases
+        self.audio_cache = None
+        if profile.get_profile_flag(['piper-tts', 'audio_cache', 'enabled'], False):
+            self.audio_cache = AudioCache(
+                os.path.join(paths.sub('piper'), 'cache'),
+                max_size=int(float(profile.get(['piper-tts', 'audio_cache', 'max_size_mb'], 100)) * 1024 * 1024)
+            )
+        # onnxruntime session options
+        self.onnx_settings = {
+            'intra_op_threads': profile.get(['piper-tts', 'onnx', 'intra_op_threads']),
+            'inter_op_threads': profile.get(['piper-tts', 'onnx', 'inter_op_threads']),
+            'graph_optimization': profile.get(['piper-tts', 'onnx', 'graph_optimization'], 'all'),
+            'execution_mode': profile.get(['piper-tts', 'onnx', 'execution_mode'], 'sequential'),
+            'optimized_model': profile.get_profile_flag(['piper-tts', 'onnx', 'optimized_model'], False)
+        }
+        # Use int8 quantized copies of the voice models, which are smaller
+        # and faster on low-power CPUs at some cost in quality
+        self.quantized = profile.get_profile_flag(['piper-tts', 'quantized'], False)
+        # Optionally synthesize the sentences of long phrases in parallel
+        self.sentence_pool = None
+        workers = int(profile.get(['piper-tts', 'parallel', 'workers'], 0))
+        if workers > 1:
+            # By default keep workers for as many voices as the voice cache
+            # holds, so alternating voices doesn't restart the workers
+            self.sentence_pool = SentencePool(
+                workers,
+                self.onnx_settings,
+                max_models=int(profile.get(
+                    ['piper-tts', 'parallel', 'max_models'],
+                    self.voice_cache.max_voices or 1
+                ))
+            )
+        # Convert output to the playback device's native format. By default
+        # audio is returned as 16 bit mono at the voice's own sample rate.
+        self.output_sample_rate = profile.get(['piper-tts', 'output', 'sample_rate'])
+        if self.output_sample_rate:
+            self.output_sample_rate = int(self.output_sample_rate)
+        self.output_sample_format = profile.get(['piper-tts', 'output', 'format'], 'int16')
+        self.output_channels = int(profile.get(['piper-tts', 'output', 'channels'], 1))
+        # Trim the near-silence at the start and end of each phrase, and
+        # optionally shorten long pauses between sentences
+        self.trim_silence = profile.get_profile_flag(['piper-tts', 'trim', 'enabled'], False)
+        max_pause = profile.get(['piper-tts', 'trim', 'max_pause_ms'])
+        self.trim_settings = {
+            'threshold_db': float(profile.get(['piper-tts', 'trim', 'threshold_db'], -40)),
+            'padding_ms': int(profile.get(['piper-tts', 'trim', 'padding_ms'], 50)),
+            'max_pause_ms': int(max_pause) if max_pause else None
+        }
+        # Cache phoneme ids for sentences we say often
+        self.phoneme_cache = None
+        if profile.get_profile_flag(['piper-tts', 'phoneme_cache', 'enabled'], False):
+            filename = None
+            if profile.get_profile_flag(['piper-tts', 'phoneme_cache', 'persist'], False):
+                filename = os.path.join(paths.sub('piper'), 'phonemes.json')
+            self.phoneme_cache = PhonemeCache(
+                max_entries=int(profile.get(['piper-tts', 'phoneme_cache', 'max_entries'], 2000)),
+                filename=filename
+            )
+            if filename:
+                atexit.register(self.phoneme_cache.save)
+        # Number of sentences say_many() sends through the model at once
+        self.batch_size = int(profile.get(['piper-tts', 'batch_size'], 8))
+        self.last_batch_stats = {}
+        # asay() and asay_stream() run synthesis on a single background
+        # thread, since a plugin instance only works on one phrase at a
+        # time. At most async_max_pending requests can be waiting for it.
+        self.async_max_pending = int(profile.get(['piper-tts', 'async', 'max_pending'], 4))
+        self._async_executor = None
+        self._async_slots = None
+        # Synthesize a short phrase as soon as a voice is loaded so the
+        # first real phrase doesn't pay for onnxruntime's lazy allocation
+        # and the phonemizer's first use
+        self.warmup = profile.get_profile_flag(['piper-tts', 'warmup'], False)
+        self.warmup_time = {}
         self.load_model(self.voice)
+        # Load any other voices we expect to use in the background
+        preload = [
+            voice.split('#')[0]
+            for voice in profile.get(['piper-tts', 'preload'], [])
+        ]
+        self.preload_thread = None
+        if preload:
+            self.preload_thread = threading.Thread(
+                target=self.preload_voices,
+                args=(preload,),
+                name="piper-tts-preload",
+                daemon=True
+            )
+            self.preload_thread.start()
+
+    def get_voice(self, voice, locale=None):
+        """
+        Return the loaded PiperVoice for voice, installing and loading it
+        if it is not already in the voice cache. Safe to call from more than
+        one thread.
+        """
+        if locale is None:
+            locale = profile.get(['language'])
+        return self.voice_cache.get(
+            (locale, voice),
+            lambda: self._load_voice(locale, voice)
+        )
+
+    def _load_voice(self, locale, voice):
+        self.install_voice(locale, voice)
+        if self.quantized:
+            self.quantize_voice(locale, voice)
+        return self.open_voice(locale, voice)
+
+    def quantize_voice(self, locale, voice):
+        """
+        Create the int8 copy of an installed voice if it doesn't exist yet.
+        If that fails the original model is used.
+        """
+        try:
+            quantize.quantize_voice(self.get_model_file(voice, locale))
+        except Exception as e:
+            self._logger.warning(
+                f"Unable to quantize Piper voice {voice}, using the original model: {e}"
+            )
+
+    def open_voice(self, locale, voice):
+        """
+        Load a voice that is already installed, without checking or
+        downloading anything. Returns a (PiperVoice, size) tuple for the
+        voice cache.
+        """
+        model_file = self.get_runtime_model_file(voice, locale)
+        config = self.get_voice_config(voice, locale).config
+        with self.instrumentation.span('model_load', voice=voice):
+            pipervoice = load_voice(model_file, self.onnx_settings, config=config)
+        self.instrumentation.count('model_loads')
+        if self.warmup:
+            start = time.perf_counter()
+            for block in pipervoice.synthesize_stream_raw("Hello."):
+                pass
+            self.warmup_time[(locale, voice)] = time.perf_counter() - start
+            self._logger.info(
+                f"Warmed up Piper voice {voice} in {self.warmup_time[(locale, voice)]:.3f}s"
+            )
+        # The memory used by a loaded voice is roughly the size of its model
+        return pipervoice, os.path.getsize(model_file)
+
+    def preload_voices(self, voices):
+        """
+        Load voices into the voice cache. This runs on a background thread
+        at startup. say() can be called at the same time: if it needs a
+        voice that is still being preloaded it waits for that load to finish
+        instead of starting a second one.
+        """
+        locale = profile.get(['language'])
+        for voice in voices:
+            if voice not in self.voices[locale]:
+                self._logger.warning(f"Unable to preload unknown Piper voice {voice}")
+                continue
+            try:
+                self.get_voice(voice, locale)
+            except Exception as e:
+                self._logger.warning(f"Unable to preload Piper voice {voice}: {e}")
 
     def load_model(self, voice):
         locale = profile.get(['language'])
-        self.install_voice(locale, voice)
-        model_dir = os.path.join(paths.sub('piper'), locale, voice)
-        model_file = os.path.join(model_dir, self.voices[profile.get("language")][voice]['model_file'])
-        config_file = f"{model_file}.json"
-        self.pipervoice = PiperVoice.load(model_file)
+        self.pipervoice = self.get_voice(voice, locale)
         # Get the sample rate from the config file
         try:
-            with open(config_file) as f:
-                config = json.load(f)
-            self.sample_rate[voice] = config['audio']['sample_rate']
+            self.sample_rate[voice] = self.get_voice_config(voice, locale).sample_rate
         except Exception as e:
             print(e)
             self.sample_rate[voice] = 22050
@@ -305,16 +492,22 @@ class PiperTTSPlugin(plugin.TTSPlugin):
         return [voice for voice in self.voices[locale]]
 
     def install_voice(self, locale, voice):
+        """
+        Download the model and config for a voice if they are missing or
+        incomplete. Both files are fetched at the same time, interrupted
+        downloads are resumed, and files are checked against the sizes and
+        hashes recorded when they were downloaded.
+        """
         model_dir = os.path.join(paths.sub('piper'), locale, voice)
-        os.makedirs(model_dir, exist_ok=True)
-        model_url = self.voices[locale][voice]['model_url']
-        model_filename = os.path.join(model_dir, self.voices[locale][voice]['model_file'])
-        if not os.path.isfile(model_filename):
-            app_utils.download_file(model_url, model_filename)
-        config_url = self.voices[locale][voice]['config_url']
-        config_filename = os.path.join(model_dir, f"{self.voices[locale][voice]['model_file']}.json")
-        if not os.path.isfile(config_filename):
-            app_utils.download_file(config_url, config_filename)
+        model_file = self.voices[locale][voice]['model_file']
+        installer.install(
+            model_dir,
+            {
+                model_file: self.voices[locale][voice]['model_url'],
+                f"{model_file}.json": self.voices[locale][voice]['config_url']
+            },
+            verify=profile.get_profile_flag(['piper-tts', 'verify_voices'], False)
+        )
 
     def get_speakers(self, voice=None):
         """
@@ -325,9 +518,7 @@ class PiperTTSPlugin(plugin.TTSPlugin):
             voice = profile.get(['piper-tts', 'voice'])
         if voice is None:
             return ['Default']
-        model_dir = os.path.join(paths.sub('piper'), locale, voice)
-        model_filename = os.path.join(model_dir, self.voices[locale][voice]['model_file'])
-        config_filename = os.path.join(model_dir, f"{model_filename}.json")
+        config_filename = f"{self.get_model_file(voice, locale)}.json"
         if not os.path.isfile(config_filename):
             # We have to download at least the config file to get a list of voices
             # As this list is not very descriptive, we might as well go ahead
@@ -337,9 +528,7 @@ class PiperTTSPlugin(plugin.TTSPlugin):
                 locale,
                 voice
             )
-        with open(config_filename) as f:
-            config = json.load(f)
-        speaker_id_map = config['speaker_id_map']
+        speaker_id_map = self.get_voice_config(voice, locale).speaker_id_map
         if len(speaker_id_map):
             speakers = [speaker for speaker in speaker_id_map]
         else:
@@ -349,60 +538,546 @@ class PiperTTSPlugin(plugin.TTSPlugin):
     def get_speaker_id(self, voice, speaker):
         """
         Convert a speaker string to an id
-        If the
+        If the voice is not installed or has no such speaker, returns None
         """
         locale = profile.get(['language'])
-        model_dir = os.path.join(paths.sub('piper'), locale, voice)
-        model_filename = os.path.join(model_dir, self.voices[locale][voice]['model_file'])
-        config_filename = os.path.join(model_dir, f"{model_filename}.json")
+        config_filename = f"{self.get_model_file(voice, locale)}.json"
         speaker_id = None
         if os.path.isfile(config_filename):
-            with open(config_filename) as f:
-                config = json.load(f)
-            speaker_id_map = config['speaker_id_map']
+            speaker_id_map = self.get_voice_config(voice, locale).speaker_id_map
             if speaker in speaker_id_map:
                 speaker_id = speaker_id_map[speaker]
         return speaker_id
 
-    # This plugin can receive a voice as a third parameter. This allows easier
-    # testing of different voices.
-    def say(self, phrase, voice=None):
-        # Any upper-case words will be spelled rather than read. For instance:
-        # "nasa" will be read "na-saw" and "NASA" will be read "EN AY ES AY"
-        # Also, a word with numbers in it will only be read up to the first
-        # number, so for words like "MyWifi5248Network" we need to split the
-        # string into letters and numbers
+    def get_voice_config(self, voice, locale=None):
+        """
+        Parsed config for a voice. The file is only read again if it has
+        changed since it was last parsed.
+        """
+        with self.instrumentation.span('config_parse', voice=voice):
+            return self.voice_configs.get(f"{self.get_model_file(voice, locale)}.json")
+
+    @classmethod
+    def get_model_file(cls, voice, locale=None):
+        """
+        Full path to the ONNX model for a voice
+        """
+        if locale is None:
+            locale = profile.get(['language'])
+        model_dir = os.path.join(paths.sub('piper'), locale, voice)
+        return os.path.join(model_dir, cls.voices[locale][voice]['model_file'])
+
+    def get_runtime_model_file(self, voice, locale=None):
+        """
+        The model file actually loaded for a voice: its int8 copy if
+        quantized voices are enabled and the copy exists, otherwise the
+        original model
+        """
+        model_file = self.get_model_file(voice, locale)
+        if self.quantized:
+            quantized_file = quantize.quantized_model_file(model_file)
+            if os.path.isfile(quantized_file):
+                return quantized_file
+        return model_file
+
+    def resolve_voice(self, voice=None):
+        """
+        Work out which voice and speaker id to use for a phrase without
+        loading the voice model.
+        Returns a (voice, speaker_id) tuple.
+        """
         if voice:
             if "#" in voice:
                 # split voice and speaker at '#'
                 voice, speaker = voice.split('#')
-                if voice != self.voice:
-                    self.load_model(voice)
-                    self.current_voice = voice
+                # The speaker map lives in the voice's config file. Only
+                # install the voice if that is missing, so a repeated
+                # override doesn't touch the manifest on every phrase.
+                locale = profile.get(['language'])
+                if not os.path.isfile(f"{self.get_model_file(voice, locale)}.json"):
+                    self.install_voice(locale, voice)
                 speaker_id = self.get_speaker_id(voice, speaker)
                 if speaker_id != self.speaker_id:
                     self.current_speaker_id = speaker_id
             else:
-                if voice != self.current_voice:
-                    self.load_model(voice)
-                    self.current_voice = voice
                 speaker_id = None
         else:
             # If a voice is not passed in, use the default voice
             voice = self.voice
-            if voice != self.current_voice:
-                self.load_model(voice)
-                self.current_voice = voice
             speaker_id = self.speaker_id
-        output = self.pipervoice.synthesize_stream_raw(phrase, speaker_id)
-        byte_output = b''
-        for block in output:
-            byte_output += block
-        # Get the sample rate from the config file
-        return self.pcm2wav(byte_output, sample_rate=self.sample_rate[voice], bits_per_sample=16, channels=1)
+        return voice, speaker_id
+
+    def activate_voice(self, voice):
+        """
+        Make voice the current voice, loading its model if necessary
+        """
+        if voice != self.current_voice:
+            self.load_model(voice)
+            self.current_voice = voice
+            self.instrumentation.count('voice_switches')
+
+    def select_voice(self, voice=None):
+        """
+        Resolve the voice and speaker id for a phrase and load the voice
+        model. Returns a (voice, speaker_id) tuple.
+        """
+        voice, speaker_id = self.resolve_voice(voice)
+        self.activate_voice(voice)
+        return voice, speaker_id
+
+    def audio_cache_key(self, phrase, voice, speaker_id, batched=False):
+        """
+        Key for the synthesized audio of phrase in the audio cache, or None
+        if the audio cache is disabled. Audio from say_many() (batched) can
+        differ slightly from say(), so it is stored under its own key.
+        """
+        if self.audio_cache is None:
+            return None
+        locale = profile.get(['language'])
+        # The key is built before the voice is loaded, and on first use the
+        # int8 copy doesn't exist yet. So identify the model by the original
+        # file (the int8 copy is made from it) plus whether quantized voices
+        # are on, never by whichever file happens to exist.
+        model_file = self.get_model_file(voice, locale)
+        if not os.path.isfile(model_file):
+            return None
+        parts = [
+            locale,
+            voice,
+            speaker_id,
+            self.audio_cache.model_digest(model_file),
+            self.audio_cache.normalize(phrase),
+            self.output_sample_rate,
+            self.output_sample_format,
+            self.output_channels,
+            self.trim_settings if self.trim_silence else None
+        ]
+        if batched:
+            parts.append('batched')
+        if self.quantized:
+            parts.append('int8')
+        return self.audio_cache.key(*parts)
+
+    def audio_converter(self, voice):
+        """
+        A converter from the voice's raw output to the configured output
+        format. Use a new one for each phrase.
+        """
+        return AudioConverter(
+            self.sample_rate[voice],
+            self.output_sample_rate,
+            self.output_sample_format,
+            self.output_channels
+        )
+
+    def process_audio(self, blocks, voice, converter):
+        """
+        Generator applying silence trimming (if enabled) and output format
+        conversion to the raw blocks of a phrase
+        """
+        trimmer = None
+        if self.trim_silence:
+            trimmer = SilenceTrimmer(self.sample_rate[voice], **self.trim_settings)
+        for block in blocks:
+            if trimmer:
+                block = trimmer.process(block)
+            block = converter.convert(block)
+            if block:
+                yield block
+        if trimmer:
+            block = converter.convert(trimmer.finish())
+            if block:
+                yield block
+        block = converter.finish()
+        if block:
+            yield block
+
+    def phonemize(self, phrase, voice=None, pipervoice=None):
+        """
+        Split phrase into sentences and convert each one to a list of
+        phoneme ids for voice, whose loaded PiperVoice is pipervoice. By
+        default the current voice is used.
+        """
+        if voice is None:
+            voice, pipervoice = self.current_voice, self.pipervoice
+        with self.instrumentation.span('phonemize', characters=len(phrase)):
+            if self.phoneme_cache is None:
+                return self._phonemize(phrase, pipervoice)
+            # Look each sentence up separately so a phrase that is only
+            # partly familiar still benefits
+            phoneme_key = self.get_voice_config(voice).phoneme_key
+            sentences = []
+            for sentence in split_sentences(phrase):
+                key = self.phoneme_cache.key(phoneme_key, sentence)
+                phoneme_ids = self.phoneme_cache.get(key)
+                if phoneme_ids is None:
+                    phoneme_ids = self._phonemize(sentence, pipervoice)
+                    self.phoneme_cache.put(key, phoneme_ids)
+                sentences.extend(phoneme_ids)
+            return sentences
+
+    def _phonemize(self, text, pipervoice):
+        return [
+            pipervoice.phonemes_to_ids(phonemes)
+            for phonemes in pipervoice.phonemize(text)
+        ]
+
+    def synthesize(self, phrase, speaker_id=None, voice=None, pipervoice=None):
+        """
+        Generator yielding the raw 16 bit PCM for each sentence of phrase
+        using voice, whose loaded PiperVoice is pipervoice (by default the
+        current voice). This is equivalent to
+        PiperVoice.synthesize_stream_raw(), but when a sentence pool is
+        configured, phrases with more than one sentence are spread across
+        the worker processes.
+
+        The voice is fixed when this is called rather than when the first
+        block is requested, so a phrase is finished in the voice it started
+        with even if another phrase changes the current voice in between.
+        """
+        if voice is None:
+            voice, pipervoice = self.current_voice, self.pipervoice
+        return self._synthesize(phrase, speaker_id, voice, pipervoice)
+
+    def _synthesize(self, phrase, speaker_id, voice, pipervoice):
+        sentences = self.phonemize(phrase, voice, pipervoice)
+        if self.sentence_pool and len(sentences) > 1:
+            blocks = self.sentence_pool.synthesize(
+                self.get_runtime_model_file(voice),
+                sentences,
+                speaker_id
+            )
+            try:
+                for phoneme_ids in sentences:
+                    # Only time the wait for each result, not the caller
+                    with self.instrumentation.span('inference', phonemes=len(phoneme_ids), parallel=True):
+                        block = next(blocks)
+                    self.instrumentation.count('bytes_produced', len(block))
+                    yield block
+            finally:
+                blocks.close()
+        else:
+            for phoneme_ids in sentences:
+                with self.instrumentation.span('inference', phonemes=len(phoneme_ids)):
+                    block = pipervoice.synthesize_ids_to_raw(phoneme_ids, speaker_id=speaker_id)
+                self.instrumentation.count('bytes_produced', len(block))
+                yield block
+
+    # This plugin can receive a voice as a third parameter. This allows easier
+    # testing of different voices.
+    def say(self, phrase, voice=None):
+        """
+        Synthesize phrase and return it as a WAV file in a bytearray. The
+        type is the same whether the audio was synthesized or came from the
+        audio cache.
+        """
+        # Any upper-case words will be spelled rather than read. For instance:
+        # "nasa" will be read "na-saw" and "NASA" will be read "EN AY ES AY"
+        # Also, a word with numbers in it will only be read up to the first
+        # number, so for words like "MyWifi5248Network" we need to split the
+        # string into letters and numbers
+        voice, speaker_id = self.resolve_voice(voice)
+        # A cache hit is served without loading or running the model
+        cache_key = self.audio_cache_key(phrase, voice, speaker_id)
+        if cache_key:
+            wav = self.audio_cache.get(cache_key)
+            if wav is not None:
+                self.instrumentation.count('audio_cache_hits')
+                return wav
+        self.activate_voice(voice)
+        converter = self.audio_converter(voice)
+        blocks = list(self.process_audio(
+            self.synthesize(phrase, speaker_id),
+            voice,
+            converter
+        ))
+        # Copy the blocks straight into the finished file rather than
+        # joining them first and then adding the header
+        with self.instrumentation.span('wav_assembly', blocks=len(blocks)):
+            wav = self.blocks2wav(blocks, **converter.wav_params)
+        if cache_key:
+            self.audio_cache.put(cache_key, wav)
+        return wav
+
+    def say_array(self, phrase, voice=None):
+        """
+        Like say(), but returns a (samples, sample_rate) tuple where samples
+        is a NumPy array in the output format (int16 or float32, with one
+        column per channel for stereo). The array is a writable view of the
+        audio in the WAV buffer, so no copy is made.
+        """
+        wav = self.say(phrase, voice)
+        header = self.WAV_HEADER.unpack_from(wav)
+        audio_format, channels, sample_rate = header[4], header[5], header[6]
+        dtype = np.float32 if audio_format == WAVE_FORMAT_IEEE_FLOAT else np.int16
+        samples = np.frombuffer(wav, dtype=dtype, offset=44)
+        if channels > 1:
+            samples = samples.reshape(-1, channels)
+        return samples, sample_rate
+
+    def say_stream(self, phrase, voice=None, raw=False):
+        """
+        Streaming version of say(). This is a generator which yields a WAV
+        header followed by a block of PCM audio as soon as each sentence has
+        been synthesized, so playback can start before the whole phrase is
+        done. Since the final length is not known when the header is sent,
+        the size fields are set to 0xFFFFFFFF, which most players treat as
+        "read until the end of the stream".
+        If raw is True, no header is sent and only raw PCM is yielded. This
+        is 16 bit mono at self.sample_rate[voice] unless a different output
+        format is set in the profile.
+        """
+        voice, speaker_id = self.resolve_voice(voice)
+        cache_key = self.audio_cache_key(phrase, voice, speaker_id)
+        if cache_key:
+            wav = self.audio_cache.get(cache_key)
+            if wav is not None:
+                self.instrumentation.count('audio_cache_hits')
+                yield wav[44:] if raw else wav
+                return
+        self.activate_voice(voice)
+        # Bind the voice now. With asay_stream(), other phrases can change
+        # the current voice between our blocks.
+        converter = self.audio_converter(voice)
+        audio = self.process_audio(
+            self.synthesize(phrase, speaker_id, voice, self.pipervoice),
+            voice,
+            converter
+        )
+        if not raw:
+            yield self.wav_header(None, **converter.wav_params)
+        blocks = []
+        for block in audio:
+            blocks.append(block)
+            yield block
+        # Only store the utterance if the caller consumed all of it
+        if cache_key:
+            self.audio_cache.put(
+                cache_key,
+                self.blocks2wav(blocks, **converter.wav_params)
+            )
+
+    def say_many(self, phrases, voice=None):
+        """
+        Synthesize a list of phrases, returning a list of WAV files in the
+        same order. Each item in phrases is either a string, which is spoken
+        with voice, or a (phrase, voice) tuple.
+
+        Phrases that share a voice and speaker are split into sentences,
+        sorted by length to keep padding down, and sent through the model
+        batch_size sentences at a time rather than one inference per
+        phrase. Throughput figures for the call are kept in
+        self.last_batch_stats.
+        """
+        start = time.perf_counter()
+        results = [None] * len(phrases)
+        # (voice, speaker_id) -> [(index, phrase, cache_key)]
+        groups = OrderedDict()
+        for index, item in enumerate(phrases):
+            if isinstance(item, str):
+                phrase, phrase_voice = item, voice
+            else:
+                phrase, phrase_voice = item
+            phrase_voice, speaker_id = self.resolve_voice(phrase_voice)
+            cache_key = self.audio_cache_key(phrase, phrase_voice, speaker_id, batched=True)
+            if cache_key:
+                results[index] = self.audio_cache.get(cache_key)
+                if results[index] is not None:
+                    self.instrumentation.count('audio_cache_hits')
+                    continue
+            groups.setdefault((phrase_voice, speaker_id), []).append(
+                (index, phrase, cache_key)
+            )
+        sentence_count = 0
+        audio_seconds = 0.0
+        for (group_voice, speaker_id), items in groups.items():
+            self.activate_voice(group_voice)
+            # (index, sentence number, phoneme ids) for every sentence
+            sentences = []
+            blocks = {}
+            for index, phrase, cache_key in items:
+                phoneme_ids = self.phonemize(phrase)
+                blocks[index] = [b''] * len(phoneme_ids)
+                sentences.extend(
+                    (index, number, ids)
+                    for number, ids in enumerate(phoneme_ids)
+                )
+            sentences.sort(key=lambda sentence: len(sentence[2]))
+            sentence_count += len(sentences)
+            for batch_start in range(0, len(sentences), self.batch_size):
+                batch = sentences[batch_start:batch_start + self.batch_size]
+                with self.instrumentation.span('inference', batch=len(batch)):
+                    audio = synthesize_batch(
+                        self.pipervoice,
+                        [ids for index, number, ids in batch],
+                        speaker_id
+                    )
+                self.instrumentation.count('bytes_produced', sum(len(block) for block in audio))
+                for (index, number, ids), block in zip(batch, audio):
+                    blocks[index][number] = block
+            for index, phrase, cache_key in items:
+                converter = self.audio_converter(group_voice)
+                with self.instrumentation.span('wav_assembly', blocks=len(blocks[index])):
+                    results[index] = self.blocks2wav(
+                        list(self.process_audio(blocks[index], group_voice, converter)),
+                        **converter.wav_params
+                    )
+                # Data size over byte rate
+                audio_seconds += (len(results[index]) - 44) / self.WAV_HEADER.unpack_from(results[index])[7]
+                if cache_key:
+                    self.audio_cache.put(cache_key, results[index])
+        elapsed = time.perf_counter() - start
+        self.last_batch_stats = {
+            'phrases': len(phrases),
+            'sentences': sentence_count,
+            'seconds': elapsed,
+            'audio_seconds': audio_seconds,
+            'phrases_per_second': len(phrases) / elapsed if elapsed else 0.0,
+            'real_time_factor': elapsed / audio_seconds if audio_seconds else 0.0
+        }
+        self._logger.info(
+            f"Synthesized {len(phrases)} phrases ({sentence_count} sentences) in {elapsed:.3f}s"
+        )
+        return results
+
+    @asynccontextmanager
+    async def _async_slot(self):
+        if self._async_executor is None:
+            self._async_executor = ThreadPoolExecutor(
+                max_workers=1,
+                thread_name_prefix="piper-tts"
+            )
+            self._async_slots = asyncio.Semaphore(self.async_max_pending)
+        # Callers wait here once max_pending requests are queued, so work
+        # can't pile up faster than we can synthesize it
+        async with self._async_slots:
+            yield self._async_executor
+
+    async def asay_stream(self, phrase, voice=None, raw=False):
+        """
+        Asynchronous version of say_stream(). This is an async generator
+        yielding the same blocks, with synthesis done on a background
+        thread so the event loop is never blocked.
+
+        Only one block is synthesized ahead of the caller. If the task is
+        cancelled, or the caller stops iterating (for instance because the
+        user started talking), synthesis stops after the sentence currently
+        being worked on.
+        """
+        loop = asyncio.get_running_loop()
+        async with self._async_slot() as executor:
+            stream = self.say_stream(phrase, voice, raw)
+            future = loop.run_in_executor(executor, next, stream, None)
+            try:
+                while True:
+                    block = await future
+                    if block is None:
+                        break
+                    # Start on the next block while the caller handles this one
+                    future = loop.run_in_executor(executor, next, stream, None)
+                    yield block
+            finally:
+                # The executor has a single thread, so this runs once the
+                # block in progress (if any) is done
+                executor.submit(stream.close)
+
+    async def asay(self, phrase, voice=None):
+        """
+        Asynchronous version of say(), returning a WAV file in a bytearray
+        like say() does. Synthesis happens on a background thread and stops
+        between sentences if the task is cancelled.
+        """
+        blocks = [
+            block async for block in self.asay_stream(phrase, voice)
+        ]
+        if len(blocks) == 1 and blocks[0][40:44] != b'\xff\xff\xff\xff':
+            # A complete file from the audio cache
+            return blocks[0]
+        # Rebuild the file with the sizes left open in the streaming header
+        header = self.WAV_HEADER.unpack_from(blocks[0])
+        return self.blocks2wav(
+            blocks[1:],
+            sample_rate=header[6],
+            bits_per_sample=header[9],
+            channels=header[5],
+            audio_format=header[4]
+        )
 
     # https://stackoverflow.com/questions/67317366/how-to-add-header-info-to-a-wav-file-to-get-a-same-result-as-ffmpeg
     # https://stackoverflow.com/questions/28137559/can-someone-explain-wavwave-file-headers
+    WAV_HEADER = struct.Struct(
+        '<'
+        '4s'  #  1- 4 - "RIFF"
+        'I'   #  5- 8 - File size
+        '8s'  #  9-16 - "WAVEfmt "
+        'i'   # 17-20 - Size of the fmt chunk (16 for PCM)
+        'h'   # 21-22 - Format (WAVE_FORMAT_PCM or WAVE_FORMAT_IEEE_FLOAT)
+        'h'   # 23-24 - Channels
+        'i'   # 25-28 - Sample Rate
+        'i'   # 29-32 - Byte rate
+        'h'   # 33-34 - Block align
+        'h'   # 35-36 - Bits per sample
+        '4s'  # 37-40 - 'data'
+        'I'   # 41-44 - data size
+    )
+
+    @staticmethod
+    def write_wav_header(buffer, data_size, sample_rate=22050, bits_per_sample=16, channels=1, offset=0, audio_format=WAVE_FORMAT_PCM):
+        """
+        Write the 44 byte header for a PCM WAV file containing data_size
+        bytes of audio into a writable buffer (such as a bytearray) in
+        place. If data_size is None, the length is unknown (for instance
+        when streaming) and both size fields are set to 0xFFFFFFFF.
+        """
+        if data_size is None:
+            file_size = data_size = 0xFFFFFFFF
+        else:
+            file_size = data_size + 44
+        block_align = int(bits_per_sample * channels / 8)
+        PiperTTSPlugin.WAV_HEADER.pack_into(
+            buffer,
+            offset,
+            "RIFF".encode(),
+            file_size,
+            'WAVEfmt '.encode(),
+            16,
+            audio_format,
+            channels,
+            sample_rate,
+            sample_rate * block_align,
+            block_align,
+            bits_per_sample,
+            "data".encode(),
+            data_size
+        )
+
+    @staticmethod
+    def wav_header(data_size, sample_rate=22050, bits_per_sample=16, channels=1, audio_format=WAVE_FORMAT_PCM):
+        """
+        The 44 byte header for a PCM WAV file containing data_size bytes of
+        audio, or of unknown length if data_size is None
+        """
+        header = bytearray(PiperTTSPlugin.WAV_HEADER.size)
+        PiperTTSPlugin.write_wav_header(header, data_size, sample_rate, bits_per_sample, channels, audio_format=audio_format)
+        return bytes(header)
+
+    @staticmethod
+    def blocks2wav(blocks, sample_rate=22050, bits_per_sample=16, channels=1, audio_format=WAVE_FORMAT_PCM):
+        """
+        Assemble a WAV file from a list of PCM blocks. The file is built in
+        a single preallocated bytearray with the header written in place,
+        so each block is copied exactly once.
+        """
+        data_size = sum(len(block) for block in blocks)
+        wav = bytearray(44 + data_size)
+        PiperTTSPlugin.write_wav_header(wav, data_size, sample_rate, bits_per_sample, channels, audio_format=audio_format)
+        view = memoryview(wav)
+        offset = 44
+        for block in blocks:
+            view[offset:offset + len(block)] = block
+            offset += len(block)
+        return wav
+
     @staticmethod
     def pcm2wav(audio, sample_rate=22050, bits_per_sample=16, channels=1):
         channels = 1
@@ -410,19 +1085,9 @@ class PiperTTSPlugin(plugin.TTSPlugin):
         if audio.startswith("RIFF".encode()):
             return audio
         else:
-            sampleNum = len(audio)
-            rHeaderInfo = "RIFF".encode()                    #  1- 4 - "RIFF"
-            rHeaderInfo += struct.pack('i', sampleNum + 44)  #  5- 8 - File size
-            rHeaderInfo += 'WAVEfmt '.encode()               #  9-16 - "WAVEfmt "
-            rHeaderInfo += struct.pack('i', bits_per_sample) # 17-20 - bits per sample
-            rHeaderInfo += struct.pack('h', 1)               # 21-22 - WAVE_FORMAT_PCM
-            rHeaderInfo += struct.pack('h', channels)        # 23-24 - Channels
-            rHeaderInfo += struct.pack('i', sample_rate)     # 25-26 - Sample Rate
-            rHeaderInfo += struct.pack('i', sample_rate * int(bits_per_sample * channels / 8))
-            rHeaderInfo += struct.pack("h", int(bits_per_sample * channels / 8))
-            rHeaderInfo += struct.pack("h", bits_per_sample) # 35-36 - Bits per sample
-            rHeaderInfo += "data".encode()                   # 37-40 - 'data'
-            rHeaderInfo += struct.pack('i', sampleNum)       # 41-44 - file size
-            rHeaderInfo += audio
-            return rHeaderInfo
-
+            return PiperTTSPlugin.blocks2wav(
+                [audio],
+                sample_rate=sample_rate,
+                bits_per_sample=bits_per_sample,
+                channels=channels
+            )
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+Make dynamically quantized (int8) copies of installed Piper voices, and
+compare them with the original fp32 models.
+
+The quantized model is stored next to the original as <model>.int8.onnx,
+with a copy of the voice config, and is used instead of the original when
+piper-tts/quantized is set in the profile. Quantizing needs the onnx
+package, which is not otherwise required.
+
+Run from the Naomi directory, for example:
+    python -m plugins.tts.piper_tts.quantize --voice lessac_medium --compare
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from .parallel import worker_context
+from .parallel import worker_module
+
+
+def quantized_model_file(model_file):
+    root, ext = os.path.splitext(model_file)
+    return f"{root}.int8{ext}"
+
+
+def quantize_voice(model_file, force=False):
+    """
+    Create the int8 copy of model_file if it doesn't exist or is older than
+    the model. The voice config is copied too, so the quantized model can be
+    loaded like any other voice. Returns the name of the quantized model.
+    """
+    output_file = quantized_model_file(model_file)
+    if (
+        not force
+        and os.path.isfile(output_file)
+        and os.path.getmtime(output_file) >= os.path.getmtime(model_file)
+    ):
+        return output_file
+    # Only needed here, and it pulls in the onnx package
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    # Write to a temporary file so an interrupted run never leaves a
+    # broken model where the plugin would load it
+    tmp_file = f"{output_file}.tmp"
+    try:
+        quantize_dynamic(
+            model_file,
+            tmp_file,
+            weight_type=QuantType.QUInt8
+        )
+        shutil.copyfile(f"{model_file}.json", f"{output_file}.json")
+        os.replace(tmp_file, output_file)
+    finally:
+        if os.path.exists(tmp_file):
+            os.unlink(tmp_file)
+    return output_file
+
+
+def _current_rss():
+    # Resident set size now, in bytes
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def _peak_rss():
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+def _measure(model_file, config, corpus, settings):
+    # Runs in a fresh worker process so memory figures are not affected by
+    # other models
+    from .session import load_voice
+    rss_before = _current_rss()
+    start = time.perf_counter()
+    voice = load_voice(model_file, settings, config=config)
+    load_time = time.perf_counter() - start
+    synthesis_time = 0.0
+    audio_time = 0.0
+    for phrase in corpus:
+        start = time.perf_counter()
+        audio = b''.join(voice.synthesize_stream_raw(phrase))
+        synthesis_time += time.perf_counter() - start
+        # 16 bit mono
+        audio_time += len(audio) / 2 / voice.config.sample_rate
+    peak_rss = _peak_rss()
+    return {
+        'model_file': model_file,
+        'model_size': os.path.getsize(model_file),
+        'load_seconds': load_time,
+        'real_time_factor': synthesis_time / audio_time if audio_time else None,
+        'peak_rss': peak_rss,
+        'rss_increase': peak_rss - rss_before if rss_before is not None else None
+    }
+
+
+def measure(model_file, config, corpus, settings=None):
+    """
+    Load time, real-time factor, model size and memory use for model_file,
+    measured in a separate process
+    """
+    module = worker_module('quantize')
+    with ProcessPoolExecutor(max_workers=1, mp_context=worker_context()) as executor:
+        return executor.submit(
+            module._measure,
+            model_file,
+            config,
+            corpus,
+            settings or {}
+        ).result()
+
+
+def compare(model_file, config, corpus, settings=None):
+    """
+    Compare the fp32 model_file with its quantized copy, creating the copy
+    if needed
+    """
+    original = measure(model_file, config, corpus, settings)
+    quantized = measure(quantize_voice(model_file), config, corpus, settings)
+    return {
+        'fp32': original,
+        'int8': quantized,
+        'size_ratio': quantized['model_size'] / original['model_size'],
+        'speedup': (
+            original['real_time_factor'] / quantized['real_time_factor']
+            if original['real_time_factor'] and quantized['real_time_factor'] else None
+        )
+    }
+
+
+def main(argv=None):
+    from naomi import profile
+    from .benchmark import CORPUS
+    from .benchmark import installed_voices
+    from .piper_tts import PiperTTSPlugin
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        '--locale',
+        help="locale of the voices (default: the profile language)"
+    )
+    parser.add_argument(
+        '--voice',
+        action='append',
+        help="voice to quantize, may be repeated (default: all installed)"
+    )
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help="quantize again even if a quantized copy exists"
+    )
+    parser.add_argument(
+        '--compare',
+        action='store_true',
+        help="measure the original and quantized models and report on both"
+    )
+    parser.add_argument(
+        '--output',
+        help="file to write the JSON comparison to (default: stdout)"
+    )
+    args = parser.parse_args(argv)
+
+    locale = args.locale or profile.get(['language'])
+    voices = args.voice or installed_voices(locale)
+    report = []
+    for voice in voices:
+        model_file = PiperTTSPlugin.get_model_file(voice, locale)
+        print(f"Quantizing {locale} {voice}", file=sys.stderr)
+        quantize_voice(model_file, force=args.force)
+        if args.compare:
+            config = PiperTTSPlugin.voice_configs.get(f"{model_file}.json").config
+            result = compare(model_file, config, CORPUS.get(locale, CORPUS['en-US']))
+            result.update({'locale': locale, 'voice': voice})
+            report.append(result)
+    if args.compare:
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=2)
+        else:
+            json.dump(report, sys.stdout, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,110 @@
+import json
+import logging
+import os
+import onnxruntime
+from piper.config import PiperConfig
+from piper.voice import PiperVoice
+
+_logger = logging.getLogger(__name__)
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    'disable': onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    'basic': onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    'extended': onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    'all': onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+}
+
+EXECUTION_MODES = {
+    'sequential': onnxruntime.ExecutionMode.ORT_SEQUENTIAL,
+    'parallel': onnxruntime.ExecutionMode.ORT_PARALLEL
+}
+
+
+def make_session_options(settings):
+    """
+    Build onnxruntime.SessionOptions from a dictionary of settings with the
+    same keys as the piper-tts/onnx section of the profile.
+    """
+    options = onnxruntime.SessionOptions()
+    if settings.get('intra_op_threads'):
+        options.intra_op_num_threads = int(settings['intra_op_threads'])
+    if settings.get('inter_op_threads'):
+        options.inter_op_num_threads = int(settings['inter_op_threads'])
+    options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[
+        settings.get('graph_optimization') or 'all'
+    ]
+    options.execution_mode = EXECUTION_MODES[
+        settings.get('execution_mode') or 'sequential'
+    ]
+    return options
+
+
+def optimized_model_file(model_file, settings):
+    """
+    Where the optimized graph for model_file is kept. The optimization level
+    is part of the name since each level produces a different graph.
+    """
+    root, ext = os.path.splitext(model_file)
+    level = settings.get('graph_optimization') or 'all'
+    return f"{root}.{level}-optimized{ext}"
+
+
+def _create_session(model_file, options):
+    return onnxruntime.InferenceSession(
+        model_file,
+        sess_options=options,
+        providers=["CPUExecutionProvider"]
+    )
+
+
+def load_session(model_file, settings):
+    """
+    Create an inference session for model_file. If the optimized_model
+    setting is on, the optimized graph is saved next to the model the first
+    time it is loaded and used directly afterwards, so the graph
+    optimization work is only done once.
+    """
+    options = make_session_options(settings)
+    if not settings.get('optimized_model'):
+        return _create_session(model_file, options)
+    optimized_file = optimized_model_file(model_file, settings)
+    if (
+        os.path.isfile(optimized_file)
+        and os.path.getmtime(optimized_file) >= os.path.getmtime(model_file)
+    ):
+        # The graph has already been optimized
+        options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS['disable']
+        try:
+            return _create_session(optimized_file, options)
+        except Exception as e:
+            _logger.warning(f"Unable to load {optimized_file}, re-optimizing: {e}")
+            os.unlink(optimized_file)
+            options = make_session_options(settings)
+    # Have onnxruntime write the optimized graph to a temporary file and only
+    # move it into place once the session loads, so an interrupted write is
+    # never mistaken for a usable model.
+    tmp_file = f"{optimized_file}.tmp"
+    options.optimized_model_filepath = tmp_file
+    session = _create_session(model_file, options)
+    try:
+        os.replace(tmp_file, optimized_file)
+    except OSError as e:
+        _logger.warning(f"Unable to save optimized model {optimized_file}: {e}")
+    return session
+
+
+def load_voice(model_file, settings=None, config=None):
+    """
+    Load a PiperVoice the same way PiperVoice.load() does, but with the
+    session options from settings. config is the parsed .onnx.json file and
+    is read from disk if not provided.
+    """
+    if settings is None:
+        settings = {}
+    if config is None:
+        with open(f"{model_file}.json", encoding="utf-8") as f:
+            config = json.load(f)
+    return PiperVoice(
+        config=PiperConfig.from_dict(config),
+        session=load_session(model_file, settings)
+    )
@@ -0,0 +1,112 @@
+import unittest
+import numpy as np
+from ..audio import AudioConverter
+from ..audio import SilenceTrimmer
+
+
+def tone(frequency, sample_rate, seconds=1.0, amplitude=10000):
+    t = np.arange(int(sample_rate * seconds)) / sample_rate
+    return (amplitude * np.sin(2 * np.pi * frequency * t)).astype(np.int16)
+
+
+def convert(converter, pcm, block_size=None):
+    block_size = block_size or len(pcm)
+    blocks = [
+        converter.convert(pcm[start:start + block_size])
+        for start in range(0, len(pcm), block_size)
+    ]
+    blocks.append(converter.finish())
+    return np.frombuffer(b''.join(blocks), dtype=np.int16)
+
+
+def silence(sample_rate, seconds):
+    # Quiet noise, well below the trimmer's threshold
+    rng = np.random.default_rng(0)
+    return rng.integers(-50, 50, int(sample_rate * seconds)).astype(np.int16)
+
+
+def rms(samples):
+    return np.sqrt(np.mean(samples.astype(np.float64) ** 2))
+
+
+class ResampleTest(unittest.TestCase):
+    def test_downsampling_removes_frequencies_above_nyquist(self):
+        # 10kHz can't be represented at 16kHz and must not alias
+        output = convert(AudioConverter(22050, 16000), tone(10000, 22050).tobytes())
+        self.assertLess(rms(output), 100)
+
+    def test_downsampling_keeps_speech_frequencies(self):
+        output = convert(AudioConverter(22050, 16000), tone(1000, 22050).tobytes())
+        # Leave out the filter's ramp at each end
+        self.assertAlmostEqual(rms(output[200:-200]) / rms(tone(1000, 16000)), 1.0, delta=0.02)
+
+    def test_length(self):
+        for output_rate in (16000, 44100):
+            output = convert(AudioConverter(22050, output_rate), tone(1000, 22050).tobytes())
+            self.assertLessEqual(abs(len(output) - output_rate), 2)
+
+    def test_blocks_match_one_go(self):
+        pcm = tone(440, 22050).tobytes()
+        whole = convert(AudioConverter(22050, 16000), pcm)
+        # Odd block size in bytes' worth of samples, so blocks don't line up
+        # with the filter or the output samples
+        blocked = convert(AudioConverter(22050, 16000), pcm, block_size=2 * 997)
+        self.assertEqual(len(whole), len(blocked))
+        self.assertLessEqual(np.max(np.abs(whole.astype(np.int32) - blocked)), 1)
+
+    def test_empty_blocks(self):
+        for output_rate in (16000, 44100):
+            converter = AudioConverter(22050, output_rate)
+            self.assertEqual(converter.convert(b''), b'')
+            self.assertEqual(converter.finish(), b'')
+
+
+class SilenceTrimmerTest(unittest.TestCase):
+    # 10ms frames and 50ms padding at 16kHz
+    sample_rate = 16000
+    padding = 800
+
+    def trim(self, trimmer, blocks):
+        output = [trimmer.process(block.tobytes()) for block in blocks]
+        output.append(trimmer.finish())
+        return np.frombuffer(b''.join(output), dtype=np.int16)
+
+    def test_leading_and_trailing_silence_trimmed_to_padding(self):
+        speech = tone(440, self.sample_rate, 0.5)
+        pcm = np.concatenate((silence(self.sample_rate, 0.3), speech, silence(self.sample_rate, 0.4)))
+        output = self.trim(SilenceTrimmer(self.sample_rate, padding_ms=50), [pcm])
+        self.assertEqual(len(output), self.padding + len(speech) + self.padding)
+        np.testing.assert_array_equal(output[self.padding:-self.padding], speech)
+
+    def test_pause_across_blocks_shortened(self):
+        first = tone(440, self.sample_rate, 0.2)
+        second = tone(660, self.sample_rate, 0.2)
+        pcm = np.concatenate((first, silence(self.sample_rate, 1.0), second))
+        # Split in the middle of the pause
+        middle = len(first) + self.sample_rate // 2
+        trimmer = SilenceTrimmer(self.sample_rate, padding_ms=50, max_pause_ms=300)
+        output = self.trim(trimmer, [pcm[:middle], pcm[middle:]])
+        self.assertEqual(len(output), len(first) + 4800 + len(second))
+        np.testing.assert_array_equal(output[:len(first)], first)
+        np.testing.assert_array_equal(output[-len(second):], second)
+
+    def test_speech_released_from_first_block_containing_it(self):
+        speech = tone(440, self.sample_rate, 0.2)
+        trimmer = SilenceTrimmer(self.sample_rate, padding_ms=50)
+        self.assertEqual(trimmer.process(silence(self.sample_rate, 0.2).tobytes()), b'')
+        output = np.frombuffer(
+            trimmer.process(np.concatenate((silence(self.sample_rate, 0.1), speech)).tobytes()),
+            dtype=np.int16
+        )
+        self.assertEqual(len(output), self.padding + len(speech))
+        np.testing.assert_array_equal(output[self.padding:], speech)
+
+    def test_all_silence_returns_nothing(self):
+        trimmer = SilenceTrimmer(self.sample_rate, padding_ms=50)
+        output = self.trim(trimmer, [silence(self.sample_rate, 0.5), silence(self.sample_rate, 0.25)])
+        self.assertEqual(len(output), 0)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import tempfile
+import unittest
+from .voice import make_voice
+from .voice import onnx
+from ..batch import synthesize_batch
+from ..session import load_voice
+
+
+@unittest.skipIf(onnx is None, "the onnx package is needed to build a test voice")
+class SynthesizeBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.voice = load_voice(make_voice(self.directory.name))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_single_matches_unbatched(self):
+        ids = [1, 5, 9, 2]
+        self.assertEqual(
+            synthesize_batch(self.voice, [ids]),
+            [self.voice.synthesize_ids_to_raw(ids)]
+        )
+
+    def test_longest_not_trimmed(self):
+        longest = [1, 11, 4, 30, 8, 2]
+        audio = synthesize_batch(self.voice, [[1, 5, 2], longest, [1, 7, 3, 2]])
+        self.assertEqual(audio[1], self.voice.synthesize_ids_to_raw(longest))
+
+    def test_padding_trimmed(self):
+        short = [1, 5, 2]
+        # Long enough that its padding outlasts the tail kept after the
+        # short sentence
+        long = [1] + list(range(3, 40)) + [2]
+        audio = synthesize_batch(self.voice, [short, long])
+        self.assertLess(len(audio[0]), len(audio[1]))
+        unbatched = self.voice.synthesize_ids_to_raw(short)
+        self.assertEqual(audio[0][:len(unbatched)], unbatched)
+
+
+if __name__ == '__main__':
+    unittest.main()
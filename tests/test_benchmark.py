@@ -0,0 +1,18 @@
+import unittest
+from ..benchmark import percentile
+
+
+class PercentileTest(unittest.TestCase):
+    def test_nearest_rank(self):
+        self.assertEqual(percentile([1, 2, 3, 4, 5], 50), 3)
+        self.assertEqual(percentile(list(range(1, 16)), 95), 15)
+        self.assertEqual(percentile(list(range(1, 21)), 95), 19)
+        self.assertEqual(percentile([3, 1, 2], 0), 1)
+        self.assertEqual(percentile([3, 1, 2], 100), 3)
+
+    def test_empty(self):
+        self.assertIsNone(percentile([], 50))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+import hashlib
+import http.server
+import json
+import os
+import tempfile
+import threading
+import unittest
+from .. import installer
+
+DATA = os.urandom(300000)
+NEW_DATA = os.urandom(300000)
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    """
+    Serves server.data under /file/, with ranged requests, If-Range and an
+    opaque ETag (server.etag). Any other path redirects there the way
+    Hugging Face does, with the sha256 and size of the file in the
+    X-Linked-Etag and X-Linked-Size headers of the redirect (server.linked
+    overrides the hash). If server.cut is set, the next response stops
+    after that many bytes, as if the connection dropped.
+    """
+    def log_message(self, *args):
+        pass
+
+    def redirect(self):
+        self.send_response(302)
+        self.send_header("Location", "/file/voice.onnx")
+        self.send_header("X-Linked-Etag", f'"{self.server.linked or sha256(self.server.data)}"')
+        self.send_header("X-Linked-Size", str(len(self.server.data)))
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_HEAD(self):
+        if not self.path.startswith("/file/"):
+            return self.redirect()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(self.server.data)))
+        self.send_header("ETag", self.server.etag)
+        self.end_headers()
+
+    def do_GET(self):
+        if not self.path.startswith("/file/"):
+            return self.redirect()
+        data = self.server.data
+        start = 0
+        range_header = self.headers.get("Range")
+        self.server.ranges.append(range_header)
+        if range_header and self.headers.get("If-Range", self.server.etag) == self.server.etag:
+            start = int(range_header.split("=")[1].split("-")[0])
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(data) - 1}/{len(data)}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(data) - start))
+        self.send_header("ETag", self.server.etag)
+        self.end_headers()
+        body = data[start:]
+        if self.server.cut:
+            body = body[:self.server.cut]
+            self.server.cut = None
+        self.wfile.write(body)
+
+
+class InstallTest(unittest.TestCase):
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.ranges = []
+        self.server.cut = None
+        self.server.data = DATA
+        self.server.etag = '"v1"'
+        self.server.linked = None
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/resolve/main/voice.onnx"
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, "voice.onnx")
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.directory.cleanup()
+
+    def install(self):
+        installer.install(self.directory.name, {"voice.onnx": self.url})
+
+    def read(self, filename):
+        with open(filename, "rb") as f:
+            return f.read()
+
+    def test_interrupted_download_resumes(self):
+        self.server.cut = 100000
+        with self.assertRaises(Exception):
+            self.install()
+        # Nothing is installed, but the partial file is kept
+        self.assertFalse(os.path.exists(self.filename))
+        self.assertEqual(self.read(f"{self.filename}.part"), DATA[:100000])
+        self.install()
+        self.assertEqual(self.server.ranges, [None, "bytes=100000-"])
+        self.assertEqual(self.read(self.filename), DATA)
+        self.assertFalse(os.path.exists(f"{self.filename}.part"))
+        with open(os.path.join(self.directory.name, installer.MANIFEST)) as f:
+            manifest = json.load(f)
+        self.assertEqual(manifest["voice.onnx"], {
+            'url': self.url,
+            'size': len(DATA),
+            'sha256': sha256(DATA)
+        })
+
+    def test_truncated_file_fetched_again(self):
+        self.install()
+        with open(self.filename, "r+b") as f:
+            f.truncate(1000)
+        self.install()
+        self.assertEqual(self.server.ranges, [None, None])
+        self.assertEqual(self.read(self.filename), DATA)
+
+    def test_installed_file_not_fetched_again(self):
+        self.install()
+        self.install()
+        self.assertEqual(self.server.ranges, [None])
+
+    def test_hash_from_redirect_checked(self):
+        self.server.linked = sha256(b"something else")
+        with self.assertRaises(installer.DownloadError):
+            self.install()
+        self.assertFalse(os.path.exists(self.filename))
+        self.assertFalse(os.path.exists(f"{self.filename}.part"))
+        self.assertFalse(os.path.exists(os.path.join(self.directory.name, installer.MANIFEST)))
+
+    def test_remote_info_from_redirect(self):
+        self.assertEqual(installer.remote_info(self.url), (len(DATA), sha256(DATA)))
+
+    def test_changed_file_not_resumed(self):
+        self.server.cut = 100000
+        with self.assertRaises(Exception):
+            self.install()
+        # The file is updated on the server before the download is resumed
+        self.server.data = NEW_DATA
+        self.server.etag = '"v2"'
+        self.install()
+        self.assertEqual(self.server.ranges, [None, "bytes=100000-"])
+        self.assertEqual(self.read(self.filename), NEW_DATA)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import tempfile
+import unittest
+from .voice import make_voice
+from .voice import onnx
+from ..parallel import SentencePool
+from ..session import load_voice
+
+SENTENCES = [
+    [1, 5, 9, 2],
+    [1, 7, 3, 3, 3, 2],
+    [1, 2],
+    [1, 11, 4, 30, 8, 2]
+]
+
+
+@unittest.skipIf(onnx is None, "the onnx package is needed to build a test voice")
+class SentencePoolTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.model_file = make_voice(self.directory.name)
+        self.pool = SentencePool(2)
+
+    def tearDown(self):
+        self.pool.shutdown(wait=True)
+        self.directory.cleanup()
+
+    def test_matches_serial(self):
+        voice = load_voice(self.model_file)
+        serial = [voice.synthesize_ids_to_raw(ids) for ids in SENTENCES]
+        parallel = list(self.pool.synthesize(self.model_file, SENTENCES))
+        self.assertEqual(parallel, serial)
+
+    def test_workers_kept_per_model(self):
+        other_model_file = make_voice(self.directory.name, name="other.onnx")
+        self.pool.max_models = 2
+        list(self.pool.synthesize(self.model_file, SENTENCES[:2]))
+        executor = self.pool._get_executor(self.model_file)
+        list(self.pool.synthesize(other_model_file, SENTENCES[:2]))
+        list(self.pool.synthesize(self.model_file, SENTENCES[:2]))
+        self.assertIs(self.pool._get_executor(self.model_file), executor)
+
+
+if __name__ == '__main__':
+    unittest.main()
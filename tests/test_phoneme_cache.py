@@ -0,0 +1,64 @@
+import tempfile
+import unittest
+from .voice import make_voice
+from .voice import onnx
+from ..phoneme_cache import PhonemeCache
+from ..phoneme_cache import split_sentences
+from ..session import load_voice
+
+PHRASES = [
+    "Mr. Smith will see you now. Please take a seat.",
+    "Bring something to eat, e.g. a sandwich. Lunch is not provided!",
+    "Is it ready? Yes. It is ready at 3.5 minutes past the hour.",
+    "Wait... What was that?  Did Dr. Jones\nsay something? I heard nothing.",
+    "The U.S. team won. J. R. Smith scored.",
+    "Say a    word.\tThen stop.\n\nAnd start again."
+]
+
+
+class SplitSentencesTest(unittest.TestCase):
+    def test_split(self):
+        self.assertEqual(
+            split_sentences(" Hello there.  How are\nyou? I'm fine! "),
+            ["Hello there.", "How are\nyou?", "I'm fine!"]
+        )
+
+    def test_abbreviations_not_split(self):
+        for phrase in ("Mr. Smith is here.", "Use a tool, e.g. A hammer.", "The U.S. Army", "Wait... What?"):
+            with self.subTest(phrase=phrase):
+                self.assertEqual(split_sentences(phrase), [phrase])
+
+    def test_lower_case_not_split(self):
+        self.assertEqual(split_sentences("It costs 5 dollars. or so"), ["It costs 5 dollars. or so"])
+
+
+@unittest.skipIf(onnx is None, "the onnx package is needed to build a test voice")
+class CachedPhonemesTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.voice = load_voice(make_voice(self.directory.name))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def phonemize(self, cache, phrase):
+        # The same lookup the plugin does
+        sentences = []
+        for sentence in split_sentences(phrase):
+            key = cache.key("test", sentence)
+            phonemes = cache.get(key)
+            if phonemes is None:
+                phonemes = self.voice.phonemize(sentence)
+                cache.put(key, phonemes)
+            sentences.extend(phonemes)
+        return sentences
+
+    def test_cached_matches_uncached(self):
+        cache = PhonemeCache()
+        for phrase in PHRASES:
+            with self.subTest(phrase=phrase):
+                expected = self.voice.phonemize(phrase)
+                self.assertEqual(self.phonemize(cache, phrase), expected)
+                # And again from the cache
+                self.assertEqual(self.phonemize(cache, phrase), expected)
+        self.assertGreater(cache.hits, 0)
@@ -0,0 +1,60 @@
+import struct
+import unittest
+from ..piper_tts import PiperTTSPlugin
+
+PCM = bytes(range(256)) * 40
+
+
+def baseline_pcm2wav(audio, sample_rate=22050, bits_per_sample=16, channels=1):
+    # pcm2wav() as it was before the header was written in place
+    sampleNum = len(audio)
+    rHeaderInfo = "RIFF".encode()
+    rHeaderInfo += struct.pack('i', sampleNum + 44)
+    rHeaderInfo += 'WAVEfmt '.encode()
+    rHeaderInfo += struct.pack('i', bits_per_sample)
+    rHeaderInfo += struct.pack('h', 1)
+    rHeaderInfo += struct.pack('h', channels)
+    rHeaderInfo += struct.pack('i', sample_rate)
+    rHeaderInfo += struct.pack('i', sample_rate * int(bits_per_sample * channels / 8))
+    rHeaderInfo += struct.pack("h", int(bits_per_sample * channels / 8))
+    rHeaderInfo += struct.pack("h", bits_per_sample)
+    rHeaderInfo += "data".encode()
+    rHeaderInfo += struct.pack('i', sampleNum)
+    rHeaderInfo += audio
+    return rHeaderInfo
+
+
+class WavTest(unittest.TestCase):
+    def test_pcm2wav_matches_baseline(self):
+        for sample_rate in (16000, 22050):
+            with self.subTest(sample_rate=sample_rate):
+                self.assertEqual(
+                    bytes(PiperTTSPlugin.pcm2wav(PCM, sample_rate=sample_rate)),
+                    baseline_pcm2wav(PCM, sample_rate=sample_rate)
+                )
+
+    def test_blocks2wav_matches_baseline(self):
+        blocks = [PCM[:1000], b'', PCM[1000:7000], PCM[7000:]]
+        for sample_rate in (16000, 22050):
+            with self.subTest(sample_rate=sample_rate):
+                self.assertEqual(
+                    bytes(PiperTTSPlugin.blocks2wav(blocks, sample_rate=sample_rate)),
+                    baseline_pcm2wav(PCM, sample_rate=sample_rate)
+                )
+
+    def test_wav_passed_through(self):
+        wav = baseline_pcm2wav(PCM)
+        self.assertEqual(PiperTTSPlugin.pcm2wav(wav), wav)
+
+    def test_streaming_header(self):
+        header = PiperTTSPlugin.wav_header(None, sample_rate=16000)
+        # Same as a complete file apart from the two size fields, which
+        # are set to the largest value since the length is unknown
+        expected = bytearray(baseline_pcm2wav(b'', sample_rate=16000))
+        expected[4:8] = b'\xff\xff\xff\xff'
+        expected[40:44] = b'\xff\xff\xff\xff'
+        self.assertEqual(header, bytes(expected))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+"""
+A tiny stand-in for a Piper voice, for tests. The model has the same inputs
+and output as a real voice and turns each phoneme id into a short burst of
+tone whose pitch depends on the id, so different sentences give different
+audio without needing a real voice or espeak.
+"""
+import json
+import os
+
+try:
+    import onnx
+    from onnx import TensorProto
+    from onnx import helper
+except ImportError:
+    onnx = None
+
+
+def make_voice(directory, name="test.onnx", sample_rate=16000, samples_per_phoneme=64):
+    """
+    Write the model and its config to directory. Returns the model file.
+    """
+    constant = helper.make_tensor
+    nodes = [
+        helper.make_node('Cast', ['input'], ['ids'], to=TensorProto.FLOAT),
+        helper.make_node('Mul', ['ids', 'pitch'], ['phase']),
+        helper.make_node('Sin', ['phase'], ['tone']),
+        # Scale by length_scale so the scales input is used
+        helper.make_node('Gather', ['scales', 'one'], ['length_scale']),
+        helper.make_node('Mul', ['tone', 'length_scale'], ['scaled']),
+        helper.make_node('Cast', ['input_lengths'], ['lengths'], to=TensorProto.FLOAT),
+        helper.make_node('Mul', ['lengths', 'zero'], ['zeros']),
+        helper.make_node('ReduceSum', ['zeros'], ['no_offset'], keepdims=0),
+        helper.make_node('Add', ['scaled', 'no_offset'], ['levels']),
+        # (batch, phonemes) -> (batch, 1, phonemes * samples_per_phoneme)
+        helper.make_node('Unsqueeze', ['levels', 'last_axis'], ['columns']),
+        helper.make_node('Tile', ['columns', 'repeats'], ['tiled']),
+        helper.make_node('Reshape', ['tiled', 'audio_shape'], ['flat']),
+        helper.make_node('Mul', ['flat', 'carrier'], ['output'])
+    ]
+    initializers = [
+        constant('pitch', TensorProto.FLOAT, [], [0.37]),
+        constant('one', TensorProto.INT64, [1], [1]),
+        constant('zero', TensorProto.FLOAT, [], [0.0]),
+        constant('last_axis', TensorProto.INT64, [1], [-1]),
+        constant('repeats', TensorProto.INT64, [3], [1, 1, samples_per_phoneme]),
+        constant('audio_shape', TensorProto.INT64, [3], [0, 1, -1]),
+        constant('carrier', TensorProto.FLOAT, [], [0.5])
+    ]
+    inputs = [
+        helper.make_tensor_value_info('input', TensorProto.INT64, ['batch', 'phonemes']),
+        helper.make_tensor_value_info('input_lengths', TensorProto.INT64, ['batch']),
+        helper.make_tensor_value_info('scales', TensorProto.FLOAT, [3])
+    ]
+    graph = helper.make_graph(
+        nodes,
+        'piper-test-voice',
+        inputs,
+        [helper.make_tensor_value_info('output', TensorProto.FLOAT, ['batch', 1, 'samples'])],
+        initializers
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid('', 13)])
+    model.ir_version = 8
+    model_file = os.path.join(directory, name)
+    onnx.save(model, model_file)
+    config = {
+        'num_symbols': 256,
+        'num_speakers': 1,
+        'audio': {'sample_rate': sample_rate},
+        'espeak': {'voice': 'en-us'},
+        'phoneme_id_map': {},
+        'speaker_id_map': {}
+    }
+    with open(f"{model_file}.json", 'w') as f:
+        json.dump(config, f)
+    return model_file
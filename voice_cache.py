@@ -0,0 +1,104 @@
+import threading
+from collections import OrderedDict
+
+
+class VoiceCache(object):
+    """
+    Least recently used cache of loaded PiperVoice objects.
+
+    Loading an ONNX voice takes anywhere from a few hundred milliseconds to
+    several seconds, so voices are kept in memory after use. The cache is
+    bounded by the number of voices and, optionally, by an approximate
+    memory budget. The memory used by a voice is estimated by the caller
+    (normally from the size of the model file).
+    """
+    def __init__(self, max_voices=2, max_memory=None):
+        self.max_voices = max_voices
+        # Approximate memory budget in bytes, None means unbounded
+        self.max_memory = max_memory
+        # key -> (voice, size)
+        self._voices = OrderedDict()
+        self._lock = threading.RLock()
+        # key -> lock held while that voice is being loaded
+        self._loading = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._voices
+
+    def __len__(self):
+        with self._lock:
+            return len(self._voices)
+
+    @property
+    def memory(self):
+        with self._lock:
+            return sum(size for voice, size in self._voices.values())
+
+    def get(self, key, loader):
+        """
+        Return the voice stored under key. If it is not cached, loader() is
+        called and must return a (voice, size) tuple, where size is the
+        approximate memory used by the voice in bytes.
+        Only one thread loads a given voice at a time. Other threads asking
+        for the same voice wait for that load to finish rather than loading
+        it again, while requests for other voices are not blocked.
+        """
+        with self._lock:
+            if key in self._voices:
+                self._voices.move_to_end(key)
+                self.hits += 1
+                return self._voices[key][0]
+            key_lock = self._loading.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                # Another thread may have loaded it while we were waiting
+                if key in self._voices:
+                    self._voices.move_to_end(key)
+                    self.hits += 1
+                    return self._voices[key][0]
+                self.misses += 1
+            try:
+                voice, size = loader()
+            except BaseException:
+                with self._lock:
+                    self._loading.pop(key, None)
+                raise
+            with self._lock:
+                self._voices[key] = (voice, size)
+                self._voices.move_to_end(key)
+                self._loading.pop(key, None)
+                self._evict(key)
+        return voice
+
+    def _evict(self, keep):
+        # Drop the least recently used voices until we are within our limits.
+        # The voice that was just requested is never evicted, even if it is
+        # larger than the whole budget on its own.
+        while len(self._voices) > 1:
+            over_count = self.max_voices and len(self._voices) > self.max_voices
+            over_memory = self.max_memory and self.memory > self.max_memory
+            if not (over_count or over_memory):
+                break
+            oldest = next(iter(self._voices))
+            if oldest == keep:
+                break
+            del self._voices[oldest]
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._voices.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'voices': list(self._voices),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'memory': self.memory
+            }
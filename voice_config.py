@@ -0,0 +1,60 @@
+import hashlib
+import json
+import os
+import threading
+
+
+class VoiceConfig(object):
+    """
+    The parts of a voice's .onnx.json file the plugin uses, along with the
+    full parsed config
+    """
+    def __init__(self, config, mtime):
+        self.config = config
+        self.mtime = mtime
+        self.sample_rate = config.get('audio', {}).get('sample_rate', 22050)
+        self.speaker_id_map = config.get('speaker_id_map') or {}
+        self.num_speakers = config.get('num_speakers', 1)
+        self.phoneme_type = config.get('phoneme_type', 'espeak')
+        self.espeak_voice = config.get('espeak', {}).get('voice')
+        self.phoneme_id_map = config.get('phoneme_id_map', {})
+        # Identifies how this voice turns text into phoneme ids. Voices
+        # with the same key produce the same ids for the same text.
+        self.phoneme_key = hashlib.sha256(json.dumps(
+            [self.phoneme_type, self.espeak_voice, self.phoneme_id_map],
+            sort_keys=True
+        ).encode("utf-8")).hexdigest()
+
+
+class VoiceConfigIndex(object):
+    """
+    In-memory index of parsed voice config files. A file is only parsed
+    again if its modification time changes, so looking up speakers or the
+    sample rate does not mean reading and parsing JSON every time.
+    """
+    def __init__(self):
+        # config file -> VoiceConfig
+        self._configs = {}
+        self._lock = threading.Lock()
+
+    def get(self, config_file):
+        """
+        Return the VoiceConfig for config_file. Raises OSError if the file
+        does not exist.
+        """
+        mtime = os.path.getmtime(config_file)
+        with self._lock:
+            voice_config = self._configs.get(config_file)
+        if voice_config is None or voice_config.mtime != mtime:
+            with open(config_file, encoding="utf-8") as f:
+                voice_config = VoiceConfig(json.load(f), mtime)
+            with self._lock:
+                self._configs[config_file] = voice_config
+        return voice_config
+
+    def invalidate(self, config_file=None):
+        with self._lock:
+            if config_file is None:
+                self._configs.clear()
+            else:
+                self._configs.pop(config_file, None)